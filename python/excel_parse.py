@@ -2,10 +2,13 @@
 
 import argparse
 import json
+import os
 import openpyxl
+from itertools import zip_longest
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, time
 from pathlib import Path
 from openpyxl.utils import get_column_letter
-from datetime import datetime
 
 
 def excel_to_json(input_file, sheet_name, start_row, end_row, start_col, end_col, output_file, transpose):
@@ -87,6 +90,190 @@ def excel_to_json(input_file, sheet_name, start_row, end_row, start_col, end_col
             workbook.close()
 
 
+def normalize_json_cell(json_str):
+    """
+    规整单元格中的JSON文本：去除两端空白以及末尾多余的逗号
+    """
+    # 去除字符串两端的空白字符
+    json_str = json_str.strip()
+
+    # 检查末尾是否有逗号
+    if json_str.endswith(','):
+        json_str = json_str[:-1].strip()  # 删除逗号并再次去除可能的空白字符
+    return json_str
+
+
+def _is_self_contained(text):
+    """
+    粗略判断单元格文本是否是一个独立的JSON值：引号成对，且引号之外的括号数量平衡
+    含反斜杠的文本无法简单判断引号是否被转义，一律视为不确定，交给逐个解析
+    """
+    if '\\' in text or text.count('"') % 2:
+        return False
+    outside = ''.join(text.split('"')[0::2]) if '"' in text else text
+    return (outside.count('[') == outside.count(']') and outside.count('{') == outside.count('}')
+            and not outside.startswith((']', '}')))
+
+
+def _native_cell_value(cell):
+    """
+    非文本单元格（数字、布尔、日期等）不是JSON文本，直接作为值使用：
+    数字、布尔原样返回，日期时间转为ISO格式字符串，其他类型转为字符串
+    """
+    if isinstance(cell, (datetime, date, time)):
+        return cell.isoformat()
+    if cell is None or isinstance(cell, (bool, int, float)):
+        return cell
+    return str(cell)
+
+
+def _decode_json_texts(texts):
+    """
+    批量解析规整后的JSON文本
+
+    每个文本都是独立的JSON值（括号、引号平衡）时，把整段拼接成一个JSON数组一次性解析；
+    否则、或解析失败、或元素个数对不上时，再逐个解析以定位出错的位置
+    """
+    # 快速路径：整段一次性解析，空文本按null处理
+    # 文本各自平衡时不会与相邻文本合并成一个元素（如 '[3' 与 '4]'），
+    # 文本内的逗号只会让元素变多，因此元素个数一致即说明每个元素对应一个文本
+    if all(_is_self_contained(text) for text in texts):
+        try:
+            values = json.loads('[' + ','.join(text or 'null' for text in texts) + ']')
+            if len(values) == len(texts):
+                return values, []
+        except json.JSONDecodeError:
+            pass
+
+    # 慢速路径：逐个解析，收集所有失败的文本
+    values = []
+    failures = []
+    for idx, text in enumerate(texts):
+        if not text:
+            values.append(None)
+            continue
+        try:
+            values.append(json.loads(text))
+        except json.JSONDecodeError as e:
+            values.append(None)
+            failures.append((idx, text, str(e)))
+    return values, failures
+
+
+def _decode_json_chunk(cells):
+    """
+    批量解析一段单元格（进程池任务，需为模块级函数）
+
+    只有文本单元格按JSON解析，数字、布尔、日期等单元格直接作为值，见_native_cell_value
+
+    返回:
+    (values, failures) -- values与cells等长，解析失败的位置为None；
+                          failures为[(段内下标, 规整后的文本, 错误信息)]
+    """
+    values = [None if isinstance(cell, str) else _native_cell_value(cell) for cell in cells]
+    positions = [idx for idx, cell in enumerate(cells) if isinstance(cell, str)]
+    decoded, failures = _decode_json_texts([normalize_json_cell(cells[idx]) for idx in positions])
+    for idx, value in zip(positions, decoded):
+        values[idx] = value
+    return values, [(positions[idx], text, error) for idx, text, error in failures]
+
+
+def decode_json_columns(columns, sheet_name, start_row, start_col,
+                        max_workers=None, parallel_threshold=5000, chunk_size=2000):
+    """
+    按列批量解析单元格中的JSON文本，收集所有出错单元格的坐标而不是遇错即停
+
+    参数:
+    columns -- 列数据列表，每一列是从start_row开始的单元格值列表
+    sheet_name -- 工作表名称，用于错误定位
+    start_row -- 第一行对应的行号(1-based)
+    start_col -- 第一列对应的列号(1-based)
+    max_workers -- 进程池大小，默认为CPU核数
+    parallel_threshold -- 单元格总数超过该值时才启用进程池
+    chunk_size -- 每个进程池任务包含的单元格数
+
+    返回:
+    (decoded_columns, errors)
+      decoded_columns -- 与columns同形状的解析结果，出错的单元格为None
+      errors -- 出错单元格列表，元素为
+                {'sheet', 'row', 'column', 'cell', 'value', 'error'}
+    """
+    # 将每列切分成若干段，记录(列下标, 段起始下标, 单元格)
+    tasks = []
+    for col_offset, column in enumerate(columns):
+        column = list(column)
+        for offset in range(0, len(column), chunk_size):
+            tasks.append((col_offset, offset, column[offset:offset + chunk_size]))
+
+    total_cells = sum(len(task[2]) for task in tasks)
+    if total_cells >= parallel_threshold and len(tasks) > 1:
+        workers = max_workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_decode_json_chunk, [task[2] for task in tasks]))
+    else:
+        results = [_decode_json_chunk(task[2]) for task in tasks]
+
+    decoded_columns = [[] for _ in columns]
+    errors = []
+    for (col_offset, offset, _), (values, failures) in zip(tasks, results):
+        decoded_columns[col_offset].extend(values)
+        for idx, text, message in failures:
+            row = start_row + offset + idx
+            column = start_col + col_offset
+            errors.append({
+                'sheet': sheet_name,
+                'row': row,
+                'column': column,
+                'cell': f"{get_column_letter(column)}{row}",
+                'value': text,
+                'error': message,
+            })
+    return decoded_columns, errors
+
+
+def excel_columns_to_json(input_file, sheet_name, start_row, end_row, start_col, end_col, max_workers=None,
+                          output_file=None):
+    """
+    读取Excel指定范围，并按列批量解析其中的JSON文本
+
+    参数同excel_to_json，max_workers为解析用的进程池大小；
+    output_file不为空时，与excel_to_json(transpose=True)相同，把按列读取的原始单元格内容保存为JSON
+
+    返回:
+    (decoded_columns, errors)，含义见decode_json_columns
+    """
+    if not Path(input_file).is_file():
+        raise FileNotFoundError(f"输入文件 '{input_file}' 不存在")
+    if start_row < 1 or end_row < start_row:
+        raise ValueError("行范围无效")
+    if start_col < 1 or end_col < start_col:
+        raise ValueError("列范围无效")
+
+    workbook = openpyxl.load_workbook(input_file, read_only=True, data_only=True)
+    try:
+        if sheet_name not in workbook.sheetnames:
+            raise ValueError(f"工作表 '{sheet_name}' 不存在于文件中")
+        sheet = workbook[sheet_name]
+        # 只读模式下按行流式读取，再转置为列
+        rows = sheet.iter_rows(min_row=start_row, max_row=end_row,
+                               min_col=start_col, max_col=end_col,
+                               values_only=True)
+        columns = [list(column) for column in zip(*rows)]
+    finally:
+        workbook.close()
+
+    if output_file:
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(columns, f, ensure_ascii=False, indent=2, default=_native_cell_value)
+        print(f"成功将数据保存到 '{output_file}'")
+
+    decoded_columns, errors = decode_json_columns(columns, sheet_name, start_row, start_col,
+                                                  max_workers=max_workers)
+    print(f"解析范围: {get_column_letter(start_col)}{start_row}:{get_column_letter(end_col)}{end_row}, "
+          f"出错单元格: {len(errors)}")
+    return decoded_columns, errors
+
+
 def parse_json_array(json_strings):
     """
     解析包含JSON字符串的数组，返回解析后的对象数组
@@ -99,12 +286,7 @@ def parse_json_array(json_strings):
     """
     parsed_objects = []
     for json_str in json_strings:
-        # 去除字符串两端的空白字符
-        json_str = json_str.strip()
-
-        # 检查末尾是否有逗号
-        if json_str.endswith(','):
-            json_str = json_str[:-1].strip()  # 删除逗号并再次去除可能的空白字符
+        json_str = normalize_json_cell(json_str)
 
         try:
             obj = json.loads(json_str)
@@ -165,6 +347,127 @@ def update_json_property(json_file_path, property_path, new_value):
         return False
 
 
+def iter_json_rows(input_file):
+    """
+    逐行读取JSON数据源
+
+    .jsonl 文件按行流式读取（每行一个数组），其他文件按二维数组整体加载
+    """
+    if Path(input_file).suffix.lower() == '.jsonl':
+        with open(input_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        return
+
+    with open(input_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    yield from data
+
+
+def _to_cell_value(value):
+    """
+    将JSON值转换为可写入单元格的值，对象和数组序列化为紧凑的JSON文本
+    """
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+    return value
+
+
+def write_sheets_to_excel(output_file, sheet_specs, template_file=None):
+    """
+    使用write_only模式流式写入多个工作表，一次性生成Excel文件
+
+    write_only模式只能新建工作簿，无法打开已有文件，output_file会被整体覆盖；
+    需要写入已有模板（保留其他工作表、格式等）时传入template_file，
+    此时改用普通模式加载模板逐个单元格写入，内存占用随数据量增长
+
+    参数:
+    output_file -- 输出的Excel文件路径
+    sheet_specs -- 工作表配置列表，每项为字典:
+                   sheet_name: 工作表名称
+                   rows: 行数据的可迭代对象（与input_file二选一）
+                   input_file: JSON/JSONL数据文件路径
+                   start_row: 起始行号(1-based)，默认1
+                   start_col: 起始列号(1-based)，默认1
+                   transpose: 是否行列转置，默认False
+    template_file -- 模板Excel文件路径，默认None表示新建工作簿
+
+    返回:
+    dict -- 每个工作表写入的数据行数
+    """
+    if template_file:
+        workbook = openpyxl.load_workbook(template_file)
+    else:
+        # write_only模式下行写入后即落盘，内存占用与总行数无关
+        workbook = openpyxl.Workbook(write_only=True)
+    written = {}
+    try:
+        for spec in sheet_specs:
+            sheet_name = spec['sheet_name']
+            start_row = spec.get('start_row', 1)
+            start_col = spec.get('start_col', 1)
+            if start_row < 1 or start_col < 1:
+                raise ValueError(f"工作表 '{sheet_name}' 的起始行列无效")
+
+            rows = spec['rows'] if 'rows' in spec else iter_json_rows(spec['input_file'])
+            if spec.get('transpose'):
+                # 转置需要拿到全部行，zip_longest按列惰性生成新行，较短的行用None补齐
+                rows = zip_longest(*list(rows))
+
+            count = 0
+            if template_file:
+                # 模板中已有的同名工作表直接写入，保留其中其他单元格
+                sheet = workbook[sheet_name] if sheet_name in workbook.sheetnames \
+                    else workbook.create_sheet(title=sheet_name)
+                for row_offset, row in enumerate(rows):
+                    for col_offset, value in enumerate(row):
+                        sheet.cell(row=start_row + row_offset, column=start_col + col_offset,
+                                   value=_to_cell_value(value))
+                    count += 1
+            else:
+                sheet = workbook.create_sheet(title=sheet_name)
+                # write_only只能顺序追加，用空行和空列定位到起始单元格
+                for _ in range(start_row - 1):
+                    sheet.append([])
+                padding = [None] * (start_col - 1)
+                for row in rows:
+                    sheet.append(padding + [_to_cell_value(value) for value in row])
+                    count += 1
+            written[sheet_name] = count
+            print(f"已写入: {sheet_name} {count}行，起始单元格 {get_column_letter(start_col)}{start_row}")
+
+        workbook.save(output_file)
+        print(f"成功将数据保存到 '{output_file}'")
+        return written
+    finally:
+        workbook.close()
+
+
+def json_to_excel(input_file, output_file, sheet_name, start_row=1, start_col=1, transpose=False,
+                  template_file=None):
+    """
+    excel_to_json的逆操作：将JSON二维数组写入Excel的指定位置
+
+    参数:
+      input_file: 输入的JSON/JSONL文件路径
+      output_file: 输出的Excel文件路径
+      sheet_name: 要写入的工作表名称
+      start_row: 起始行号(1 - based)
+      start_col: 起始列号(1 - based)
+      transpose: 是否行列转置
+      template_file: 模板Excel文件路径，写入其中的工作表后保存为output_file，默认新建工作簿
+    """
+    return write_sheets_to_excel(output_file, [{
+        'sheet_name': sheet_name,
+        'input_file': input_file,
+        'start_row': start_row,
+        'start_col': start_col,
+        'transpose': transpose,
+    }], template_file)
+
+
 if __name__ == "__main__":
     # 设置命令行参数
     parser = argparse.ArgumentParser(description='将Excel文件中的指定范围数据转换为JSON')
@@ -180,10 +483,19 @@ if __name__ == "__main__":
     json_root = "/path/to/storage_json_directory"
     json_fields_d = ['data', 'items']
     json_fields_t = ['data', 'items', 0, 'data']
+    targets = [
+        ('ios_{}_detail.json', json_fields_d, 1),
+        ('ios_{}_pv_trend.json', json_fields_t, 3),
+        ('ios_{}_uv_trend.json', json_fields_t, 5),
+        ('android_{}_detail.json', json_fields_d, 0),
+        ('android_{}_pv_trend.json', json_fields_t, 2),
+        ('android_{}_uv_trend.json', json_fields_t, 4),
+    ]
+    all_errors = []
     for i in range(1, 4):
         sheet_name0 = "推广点位" + str(i)
-        sheet_read_output_filename = f'sheet_{i}_{get_column_letter(args.start_col)}{args.start_row}:{get_column_letter(args.end_col)}{args.end_row}_{datetime.now().strftime('%y%m%d_%H%M%S')}.json'
-        excel_read_results = excel_to_json(
+        sheet_read_output_filename = f'sheet_{i}_{get_column_letter(args.start_col)}{args.start_row}:{get_column_letter(args.end_col)}{args.end_row}_{datetime.now().strftime("%y%m%d_%H%M%S")}.json'
+        decoded_columns, decode_errors = excel_columns_to_json(
             input_file=xlsx_path,
             sheet_name=sheet_name0,
             start_row=args.start_row,
@@ -191,15 +503,15 @@ if __name__ == "__main__":
             start_col=args.start_col,
             end_col=args.end_col,
             output_file=sheet_read_output_filename,
-            transpose=True,
         )
-        update_json_property(f"{json_root}/ios_{i}_detail.json", json_fields_d, parse_json_array(excel_read_results[1]))
-        update_json_property(f"{json_root}/ios_{i}_pv_trend.json", json_fields_t,
-                             parse_json_array(excel_read_results[3]))
-        update_json_property(f"{json_root}/ios_{i}_uv_trend.json", json_fields_t,
-                             parse_json_array(excel_read_results[5]))
-        update_json_property(f"{json_root}/android_{i}_detail.json", json_fields_d, parse_json_array(excel_read_results[0]))
-        update_json_property(f"{json_root}/android_{i}_pv_trend.json", json_fields_t,
-                             parse_json_array(excel_read_results[2]))
-        update_json_property(f"{json_root}/android_{i}_uv_trend.json", json_fields_t,
-                             parse_json_array(excel_read_results[4]))
+        all_errors.extend(decode_errors)
+        bad_columns = {e['column'] - args.start_col for e in decode_errors}
+        for file_pattern, json_fields, col_offset in targets:
+            # 有出错单元格的列不回写，其余列照常更新，避免一个坏单元格导致整体重跑
+            if col_offset in bad_columns:
+                print(f"跳过: {sheet_name0} 第{args.start_col + col_offset}列存在非法JSON")
+                continue
+            update_json_property(f"{json_root}/{file_pattern.format(i)}", json_fields, decoded_columns[col_offset])
+
+    for error in all_errors:
+        print(f"非法JSON: {error['sheet']}!{error['cell']} -> {error['error']}")
@@ -1,34 +1,255 @@
 # -*- coding: utf-8 -*-
 
 
+import argparse
+import json
 import os
-from datetime import datetime
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from PIL import Image
 # import re
 # import time
 
+# 每次执行重命名前写入的撤销日志，记录 [(原文件名, 新文件名), ...]
+JOURNAL_NAME = '.rename_journal.json'
+
+# 可读取拍摄时间的文件类型
+EXIF_EXTENSIONS = {'.jpg', '.jpeg', '.tif', '.tiff', '.png', '.webp'}
+MP4_EXTENSIONS = {'.mp4', '.mov', '.m4v', '.3gp'}
+
+# EXIF 标签：Exif IFD、拍摄时间（DateTimeOriginal）、修改时间（DateTime）
+EXIF_IFD = 0x8769
+EXIF_DATETIME_ORIGINAL = 36867
+EXIF_DATETIME = 306
+
+# MP4 的时间从 1904-01-01 UTC 起算
+MP4_EPOCH = datetime(1904, 1, 1, tzinfo=timezone.utc)
+
+
+def read_exif_time(file_path):
+    """
+    读取图片 EXIF 中的拍摄时间，Image.open 只解析文件头，不解码像素
+    PNG 的 getexif() 在文件头中找不到 eXIf 块时会 load() 解码全部像素，因此只使用文件头中已读到的 eXIf
+    EXIF 时间没有时区，按本地时间处理
+    :return: 时间戳，没有拍摄时间时返回 None
+    """
+    with Image.open(file_path) as img:
+        if img.format == 'PNG':
+            raw = img.info.get('exif')
+            if not raw:
+                return None
+            exif = Image.Exif()
+            exif.load(raw)
+        else:
+            exif = img.getexif()
+        value = exif.get_ifd(EXIF_IFD).get(EXIF_DATETIME_ORIGINAL) or exif.get(EXIF_DATETIME)
+    if not value:
+        return None
+    return datetime.strptime(str(value).strip('\x00 ')[:19], '%Y:%m:%d %H:%M:%S').timestamp()
+
+
+def _read_exact(f, size):
+    """读取 size 个字节，文件被截断时报错"""
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("文件不完整")
+    return data
+
+
+def _iter_boxes(f, end):
+    """依次读取 [当前位置, end) 范围内的 MP4 box 头，返回 (类型, 内容起始位置, 内容结束位置)"""
+    while f.tell() + 8 <= end:
+        start = f.tell()
+        size, box_type = struct.unpack('>I4s', _read_exact(f, 8))
+        header = 8
+        if size == 1:
+            size = struct.unpack('>Q', _read_exact(f, 8))[0]
+            header = 16
+        elif size == 0:
+            size = end - start
+        if size < header:
+            return
+        yield box_type, start + header, start + size
+        f.seek(start + size)
+
+
+def read_mp4_time(file_path):
+    """
+    读取 MP4/MOV 的 moov/mvhd 中的创建时间，只在 box 头之间跳转，不读取媒体数据
+    :return: 时间戳，没有记录创建时间时返回 None
+    """
+    with open(file_path, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        for box_type, start, end in _iter_boxes(f, file_size):
+            if box_type != b'moov':
+                continue
+            f.seek(start)
+            for child_type, child_start, _ in _iter_boxes(f, end):
+                if child_type != b'mvhd':
+                    continue
+                f.seek(child_start)
+                version = _read_exact(f, 4)[0]
+                created = struct.unpack('>Q' if version == 1 else '>I', _read_exact(f, 8 if version == 1 else 4))[0]
+                if not created:
+                    return None
+                return MP4_EPOCH.timestamp() + created
+            return None
+    return None
+
+
+def read_capture_time(file_path):
+    """
+    按扩展名读取拍摄时间，不支持的类型或读取失败时返回 None
+    单个文件损坏（截断、解压炸弹、无法表示的时间等）不能中断整批重命名，因此捕获所有异常
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    try:
+        if ext in EXIF_EXTENSIONS:
+            timestamp = read_exif_time(file_path)
+        elif ext in MP4_EXTENSIONS:
+            timestamp = read_mp4_time(file_path)
+        else:
+            return None
+        if timestamp is not None:
+            # 确认时间可以转换为日期，生成文件名时不会再出错
+            datetime.fromtimestamp(timestamp)
+        return timestamp
+    except Exception:
+        return None
 
-def rename_by_mtime(files_root):
-    prefix = 'wx_'
-    for file in os.listdir(files_root):
-        if file.startswith(prefix):
-            continue
-        abs_path_old = os.path.join(files_root, file)
-        datetime_instance = datetime.fromtimestamp(os.path.getmtime(abs_path_old))
-        mtime_format_name = datetime.strftime(datetime_instance,'%Y%m%d_%H%M')
-        print(mtime_format_name)
-        p = file.split('.')
-        ext = p[1]
-        abs_path_new = os.path.join(files_root, prefix + mtime_format_name + '.' + ext)
-        if os.path.exists(abs_path_new):
-            count = 2
+
+def metadata_timestamps(files_root, files, max_workers=16):
+    """
+    在线程池中并行读取拍摄时间（每个文件只读取文件头，耗时主要在磁盘 IO），读取不到时使用修改时间
+    :param files: [(文件名, 修改时间), ...]
+    :return: ([(文件名, 时间), ...], 使用修改时间的文件数)
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        captured = list(executor.map(read_capture_time, [os.path.join(files_root, name) for name, _ in files]))
+    fallback = sum(t is None for t in captured)
+    return [(name, t if t is not None else mtime) for (name, mtime), t in zip(files, captured)], fallback
+
+
+def scan_files(files_root, prefix='wx_'):
+    """
+    一次 scandir 遍历目录，stat 结果由 DirEntry 缓存，不再逐个调用 getmtime
+    :return: (待重命名的 [(文件名, 修改时间), ...], 目录中已有的全部文件名集合)
+    """
+    files = []
+    taken = set()
+    with os.scandir(files_root) as entries:
+        for entry in entries:
+            taken.add(entry.name)
+            # 已重命名的文件、隐藏文件（包括撤销日志）和子目录不处理
+            if entry.name.startswith(prefix) or entry.name.startswith('.') or not entry.is_file():
+                continue
+            files.append((entry.name, entry.stat().st_mtime))
+    return files, taken
+
+
+def plan_renames(files_root, prefix='wx_', time_format='%Y%m%d_%H%M', source='mtime', max_workers=16):
+    """
+    生成重命名计划，不修改任何文件
+    source 为 metadata 时使用 EXIF / MP4 中的拍摄时间，复制过的文件修改时间已经不准确，读取不到时使用修改时间
+    同一时间的文件依次编号 _2、_3 ...，冲突只在内存中的文件名集合里检查，
+    每个时间前缀记录下一个可用编号，同一分钟有大量文件时也不会反复探测
+    :return: [(原文件名, 新文件名), ...]，按时间排序
+    """
+    files, taken = scan_files(files_root, prefix)
+    if source == 'metadata':
+        files, fallback = metadata_timestamps(files_root, files, max_workers)
+        print(f"{len(files) - fallback} 个文件使用拍摄时间，{fallback} 个文件使用修改时间")
+    next_index = {}
+    plan = []
+    for name, timestamp in sorted(files, key=lambda f: (f[1], f[0])):
+        # splitext 只取最后一个扩展名，"a.b.jpg" 的扩展名为 ".jpg"，没有扩展名时为空
+        ext = os.path.splitext(name)[1]
+        base = prefix + datetime.fromtimestamp(timestamp).strftime(time_format)
+        key = (base, ext)
+        new_name = base + ext
+        count = next_index.get(key, 2)
+        if new_name in taken:
             while True:
-                abs_path_new = os.path.join(files_root, prefix + mtime_format_name + '_' + str(count) + '.' + ext)
-                if not os.path.exists(abs_path_new):
+                new_name = f"{base}_{count}{ext}"
+                count += 1
+                if new_name not in taken:
                     break
-                count = count + 1
-        os.rename(abs_path_old, abs_path_new)
+        next_index[key] = count
+        taken.add(new_name)
+        plan.append((name, new_name))
+    return plan
+
+
+def _rename_all(files_root, pairs):
+    """在同一目录内批量重命名，Linux 下用目录文件描述符避免每次重新解析完整路径"""
+    if os.rename in os.supports_dir_fd:
+        dir_fd = os.open(files_root, os.O_RDONLY)
+        try:
+            for old_name, new_name in pairs:
+                os.rename(old_name, new_name, src_dir_fd=dir_fd, dst_dir_fd=dir_fd)
+        finally:
+            os.close(dir_fd)
+    else:
+        for old_name, new_name in pairs:
+            os.rename(os.path.join(files_root, old_name), os.path.join(files_root, new_name))
+
+
+def execute_plan(files_root, plan):
+    """
+    执行重命名计划，执行前先写入撤销日志，中途中断也可以用 undo_renames 恢复
+    """
+    journal_path = os.path.join(files_root, JOURNAL_NAME)
+    tmp_path = journal_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'created': datetime.now().isoformat(timespec='seconds'), 'renames': plan},
+                  f, ensure_ascii=False)
+    os.replace(tmp_path, journal_path)
+    _rename_all(files_root, plan)
+
+
+def undo_renames(files_root):
+    """
+    按撤销日志把文件名改回原来的名字，已经不存在的新文件名（例如中断时尚未执行的部分）跳过
+    :return: 恢复的文件数
+    """
+    journal_path = os.path.join(files_root, JOURNAL_NAME)
+    with open(journal_path, 'r', encoding='utf-8') as f:
+        plan = json.load(f)['renames']
+    existing = set(os.listdir(files_root))
+    pairs = [(new_name, old_name) for old_name, new_name in reversed(plan)
+             if new_name in existing and old_name not in existing]
+    _rename_all(files_root, pairs)
+    os.remove(journal_path)
+    return len(pairs)
+
+
+def rename_by_mtime(files_root, prefix='wx_', dry_run=False, source='mtime', max_workers=16):
+    plan = plan_renames(files_root, prefix, source=source, max_workers=max_workers)
+    if dry_run:
+        for old_name, new_name in plan:
+            print(f"{old_name} -> {new_name}")
+        print(f"共 {len(plan)} 个文件待重命名（未执行）")
+        return plan
+    execute_plan(files_root, plan)
+    print(f"已重命名 {len(plan)} 个文件，可使用 --undo 撤销")
+    return plan
 
 
 if __name__ == '__main__':
-    files_dir = ''
-    rename_by_mtime(files_dir)
+    parser = argparse.ArgumentParser(description='按修改时间或拍摄时间批量重命名目录中的文件')
+    parser.add_argument('--dir', required=True, help='文件所在目录')
+    parser.add_argument('--prefix', default='wx_', help='新文件名前缀，已带该前缀的文件跳过')
+    parser.add_argument('--dry-run', action='store_true', help='只打印重命名计划，不修改文件')
+    parser.add_argument('--source', choices=['mtime', 'metadata'], default='mtime',
+                        help='时间来源：mtime 为修改时间，metadata 为 EXIF / MP4 中的拍摄时间（读取不到时使用修改时间）')
+    parser.add_argument('--workers', type=int, default=16, help='读取拍摄时间的线程数，默认为16')
+    parser.add_argument('--undo', action='store_true', help='按撤销日志恢复上一次重命名')
+    args = parser.parse_args()
+
+    files_dir = args.dir
+    if args.undo:
+        print(f"已恢复 {undo_renames(files_dir)} 个文件")
+    else:
+        rename_by_mtime(files_dir, args.prefix, args.dry_run, args.source, args.workers)
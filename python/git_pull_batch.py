@@ -1,12 +1,25 @@
+import argparse
+import hashlib
+import json
 import os
 import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import requests
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 
 # 加载环境变量（可选：用于存储敏感信息）
 load_dotenv()
 
 
+def _run_git(args, cwd=None):
+    """执行 git 命令，失败时抛出 CalledProcessError"""
+    return subprocess.run(['git', *args], cwd=cwd, capture_output=True, text=True, check=True)
+
+
 def clone_repository(repo_url, repo_name, clone_dir='.'):
     """
     克隆仓库到指定目录
@@ -29,12 +42,7 @@ def clone_repository(repo_url, repo_name, clone_dir='.'):
     # 执行 git clone 命令
     try:
         print(f"Cloning {repo_name} from {repo_url}...")
-        result = subprocess.run(
-            ['git', 'clone', repo_url, local_path],
-            capture_output=True,
-            text=True,
-            check=True  # 如果失败会抛出异常
-        )
+        _run_git(['clone', repo_url, local_path])
         print(f"Success: {repo_name} cloned to {local_path}")
         return True
     except subprocess.CalledProcessError as e:
@@ -42,42 +50,357 @@ def clone_repository(repo_url, repo_name, clone_dir='.'):
         return False
 
 
+def clone_args(depth=None, blob_filter=None, reference=None):
+    """
+    根据克隆策略构建 git clone 参数
+    :param depth: 浅克隆深度，只下载最近 depth 个提交
+    :param blob_filter: 部分克隆过滤器，例如 blob:none（按需下载文件内容）
+    :param reference: 共享对象缓存（裸仓库）路径，已有的对象不再下载，克隆结果通过 alternates 引用它
+    """
+    args = []
+    if depth:
+        args += ['--depth', str(depth), '--no-single-branch']
+    if blob_filter:
+        args += [f'--filter={blob_filter}']
+    if reference:
+        args += ['--reference-if-able', reference]
+    return args
+
+
+def _cache_remote_name(repo_name, url):
+    """缓存仓库中的远程名称，名称替换字符后可能重复（如 a/b 与 a__b），附加地址的哈希区分"""
+    digest = hashlib.sha1(url.encode('utf-8')).hexdigest()[:8]
+    return f"{repo_name.replace('/', '__').replace(' ', '_')}-{digest}"
+
+
+def populate_reference_cache(cache_dir, repos, max_workers=4):
+    """
+    填充共享对象缓存：每个仓库作为裸仓库的一个远程，fetch 一次即可被之后所有克隆复用
+    :param repos: [(仓库名称, 仓库地址), ...]
+    """
+    if not os.path.exists(cache_dir):
+        _run_git(['init', '--bare', '--quiet', cache_dir])
+    existing = set(_run_git(['remote'], cwd=cache_dir).stdout.split())
+    # 添加远程会修改配置文件，串行执行
+    for name, url in repos:
+        remote = _cache_remote_name(name, url)
+        if remote not in existing:
+            _run_git(['remote', 'add', remote, url], cwd=cache_dir)
+            existing.add(remote)
+
+    def fetch(remote):
+        try:
+            # 并发 fetch 时不写 FETCH_HEAD、不触发自动 gc，避免互相抢锁
+            _run_git(['-c', 'gc.auto=0', 'fetch', '--quiet', '--no-write-fetch-head', remote], cwd=cache_dir)
+            return remote, ''
+        except subprocess.CalledProcessError as e:
+            return remote, (e.stderr or str(e)).strip()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for remote, error in executor.map(fetch, list(dict.fromkeys(_cache_remote_name(name, url) for name, url in repos))):
+            if error:
+                print(f"Failed to fetch {remote} into cache: {error}")
+
+
+def sync_repository(repo_url, repo_name, clone_dir='.', depth=None, blob_filter=None, reference=None):
+    """
+    同步单个仓库：不存在时克隆，已存在时 fetch 后快进合并（等同于 pull --ff-only）
+    :param depth/blob_filter/reference: 克隆策略，见 clone_args
+    :return: 结果字典 {'name', 'action', 'status', 'seconds', 'message'}
+             action 为 clone/pull，status 为 cloned/updated/up-to-date/failed
+    """
+    local_path = os.path.join(clone_dir, repo_name)
+    started = time.perf_counter()
+    result = {'name': repo_name, 'action': 'pull' if os.path.exists(local_path) else 'clone'}
+    try:
+        if result['action'] == 'clone':
+            _run_git(['clone', *clone_args(depth, blob_filter, reference), repo_url, local_path])
+            result.update(status='cloned', message='')
+        else:
+            # 浅克隆的仓库普通 fetch 只下载新提交，保留原有的浅边界，不会拉取完整历史
+            # （fetch --depth 会重设边界，新提交与本地历史失去关联，无法快进合并）
+            _run_git(['fetch', '--prune', 'origin'], cwd=local_path)
+            # 远程仓库还没有任何分支（空仓库）时无需 pull
+            if not _run_git(['for-each-ref', '--count=1', 'refs/remotes/origin'], cwd=local_path).stdout.strip():
+                result.update(status='up-to-date', message='empty repository')
+                result['seconds'] = time.perf_counter() - started
+                return result
+            before = _run_git(['rev-parse', 'HEAD'], cwd=local_path).stdout.strip()
+            # 上面已经 fetch 过，直接快进合并，避免 pull 再 fetch 一次
+            _run_git(['merge', '--ff-only', '@{u}'], cwd=local_path)
+            after = _run_git(['rev-parse', 'HEAD'], cwd=local_path).stdout.strip()
+            if before == after:
+                result.update(status='up-to-date', message='')
+            else:
+                result.update(status='updated', message=f"{before[:8]}..{after[:8]}")
+    except subprocess.CalledProcessError as e:
+        # 只保留 git 输出的最后一行错误信息，便于在表格中展示
+        lines = (e.stderr or str(e)).strip().splitlines()
+        result.update(status='failed', message=lines[-1] if lines else '')
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+
+def sync_repositories(repos, clone_dir='.', max_workers=4, depth=None, blob_filter=None, reference=None):
+    """
+    并发同步多个仓库，同时最多运行 max_workers 个 git 进程
+    :param repos: [(仓库名称, 仓库地址), ...]
+    :param depth/blob_filter/reference: 克隆策略，见 clone_args；指定 reference 时先填充共享对象缓存
+    :return: 按仓库名称排序的结果列表，见 sync_repository
+    """
+    os.makedirs(clone_dir, exist_ok=True)
+    if reference:
+        populate_reference_cache(reference, repos, max_workers)
+    results = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(sync_repository, url, name, clone_dir, depth, blob_filter, reference)
+                   for name, url in repos]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print(f"[{len(results)}/{len(repos)}] {result['status']}: {result['name']} ({result['seconds']:.1f}s)")
+    results.sort(key=lambda r: r['name'])
+    return results
+
+
+def find_local_repositories(clone_dir):
+    """查找目录下所有已克隆的仓库（包括子 Group 对应的子目录），返回相对路径列表"""
+    repos = []
+    for root, dirs, _ in os.walk(clone_dir):
+        if '.git' in dirs:
+            repos.append(os.path.relpath(root, clone_dir))
+            dirs.clear()
+    return sorted(repos)
+
+
+def deepen_repository(local_path, depth=None):
+    """
+    按需补全浅克隆的历史：指定 depth 时再向前加深 depth 个提交，否则补全全部历史
+    :return: 结果字典，格式同 sync_repository
+    """
+    started = time.perf_counter()
+    result = {'name': local_path, 'action': 'deepen'}
+    try:
+        if not os.path.exists(os.path.join(local_path, '.git', 'shallow')):
+            result.update(status='complete', message='not shallow')
+        else:
+            _run_git(['fetch', f'--deepen={depth}' if depth else '--unshallow', 'origin'], cwd=local_path)
+            count = _run_git(['rev-list', '--count', 'HEAD'], cwd=local_path).stdout.strip()
+            result.update(status='deepened', message=f"{count} commits")
+    except subprocess.CalledProcessError as e:
+        lines = (e.stderr or str(e)).strip().splitlines()
+        result.update(status='failed', message=lines[-1] if lines else '')
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+
+def deepen_repositories(clone_dir, depth=None, max_workers=4):
+    """并发补全目录下所有浅克隆仓库的历史"""
+    paths = [os.path.join(clone_dir, name) for name in find_local_repositories(clone_dir)]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(lambda path: deepen_repository(path, depth), paths))
+    for result in results:
+        result['name'] = os.path.relpath(result['name'], clone_dir)
+    return results
+
+
+def print_results(results):
+    """打印每个仓库的同步结果表"""
+    name_width = max([len(r['name']) for r in results] + [4])
+    print(f"{'name':<{name_width}}  {'action':<6}  {'status':<10}  {'seconds':>8}  message")
+    for r in results:
+        print(f"{r['name']:<{name_width}}  {r['action']:<6}  {r['status']:<10}  {r['seconds']:>8.2f}  {r['message']}")
+    failed = sum(1 for r in results if r['status'] == 'failed')
+    print(f"Total: {len(results)}, failed: {failed}")
+
+
+class ResponseCache:
+    """
+    GitLab API 响应的磁盘缓存，按 URL 和查询参数记录 ETag、分页头和响应体，
+    再次请求时带上 If-None-Match，服务端返回 304 时直接使用缓存内容
+    """
+
+    def __init__(self, cache_path=None):
+        self.cache_path = cache_path
+        self.entries = {}
+        self.lock = threading.Lock()
+        if cache_path and os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except json.JSONDecodeError:
+                self.entries = {}
+
+    @staticmethod
+    def key(url, params):
+        return url + '?' + '&'.join(f"{k}={v}" for k, v in sorted(params.items()))
+
+    def get(self, key):
+        with self.lock:
+            return self.entries.get(key)
+
+    def put(self, key, etag, headers, body):
+        with self.lock:
+            self.entries[key] = {'etag': etag, 'headers': headers, 'body': body}
+
+    def save(self):
+        if not self.cache_path:
+            return
+        with self.lock:
+            tmp_path = self.cache_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_path)
+
+
+def create_session(api_token, pool_size=8):
+    """创建复用连接的会话，连接池大小与并发数一致"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=3)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({
+        "Authorization": f"Bearer {api_token}",
+        "Content-Type": "application/json"
+    })
+    return session
+
+
+def get_page(session, url, params, cache=None):
+    """
+    请求一页数据，有缓存时发送条件请求
+    304 时响应体使用缓存，分页相关的响应头以本次响应为准，本次响应没有时才使用缓存的值
+    :return: (响应体, 分页相关的响应头)
+    """
+    key = ResponseCache.key(url, params)
+    cached = cache.get(key) if cache else None
+    headers = {'If-None-Match': cached['etag']} if cached and cached['etag'] else {}
+
+    response = session.get(url, params=params, headers=headers, timeout=30)
+    page_headers = {name: response.headers[name] for name in ('X-Total-Pages', 'X-Next-Page')
+                    if name in response.headers}
+    if response.status_code == 304 and cached:
+        return cached['body'], dict(cached['headers'], **page_headers)
+    response.raise_for_status()
+
+    body = response.json()
+    if cache and response.headers.get('ETag'):
+        cache.put(key, response.headers['ETag'], page_headers, body)
+    return body, page_headers
+
+
+def fetch_all_pages(session, url, params, executor, cache=None):
+    """
+    获取分页接口的全部数据：先请求第一页，根据 X-Total-Pages 并发请求剩余页；
+    没有 X-Total-Pages（GitLab 对超过一万条的结果不返回总页数）时按 X-Next-Page 逐页请求
+    总页数可能来自缓存而已经过时，最后一页是满页时继续逐页请求，直到遇到不满一页的页
+    """
+    params = dict(params, page=1)
+    items, headers = get_page(session, url, params, cache)
+    total_pages = int(headers.get('X-Total-Pages') or 0)
+
+    if total_pages:
+        page_items = items
+        if total_pages > 1:
+            pages = executor.map(lambda page: get_page(session, url, dict(params, page=page), cache)[0],
+                                 range(2, total_pages + 1))
+            for page_items in pages:
+                items.extend(page_items)
+        # GitLab 默认每页20条
+        per_page = int(params.get('per_page') or 20)
+        page = total_pages
+        while len(page_items) >= per_page:
+            page += 1
+            page_items = get_page(session, url, dict(params, page=page), cache)[0]
+            items.extend(page_items)
+        return items
+
+    next_page = headers.get('X-Next-Page')
+    while next_page:
+        page_items, headers = get_page(session, url, dict(params, page=int(next_page)), cache)
+        items.extend(page_items)
+        next_page = headers.get('X-Next-Page')
+    return items
+
+
+def list_group_projects(session, gitlab_url, group_id, cache=None, max_workers=8, include_subgroups=True):
+    """
+    列出 Group 下的所有项目，可递归包含子 Group，同一层级的 Group 并发请求
+    :return: 项目列表（按项目 id 去重）
+    """
+    api = f"{gitlab_url}/api/v4"
+    params = {"per_page": 100}  # 根据需要调整分页大小
+    projects = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        level = [group_id]
+        while level:
+            # 每个 Group 的第一页在外层线程池中并发请求，剩余页交给分页线程池
+            with ThreadPoolExecutor(max_workers=max_workers) as group_executor:
+                project_pages = list(group_executor.map(
+                    lambda gid: fetch_all_pages(session, f"{api}/groups/{gid}/projects", params, executor, cache),
+                    level))
+                subgroup_pages = list(group_executor.map(
+                    lambda gid: fetch_all_pages(session, f"{api}/groups/{gid}/subgroups", params, executor, cache),
+                    level)) if include_subgroups else []
+            for page in project_pages:
+                for project in page:
+                    projects[project['id']] = project
+            level = [subgroup['id'] for page in subgroup_pages for subgroup in page]
+    return list(projects.values())
+
+
+def project_local_name(project, root_full_path=None):
+    """
+    项目的本地目录名：根 Group 下的项目沿用项目名称，子 Group 中的项目加上相对子 Group 路径，避免重名
+    """
+    namespace = project.get('namespace', {}).get('full_path', '')
+    if root_full_path and namespace.startswith(root_full_path + '/'):
+        return os.path.join(namespace[len(root_full_path) + 1:], project['name'])
+    return project['name']
+
+
 def main():
+    parser = argparse.ArgumentParser(description='批量克隆或更新 GitLab Group 下的仓库')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('GIT_WORKERS', 4)),
+                        help='同时运行的 git 进程数，默认为4')
+    parser.add_argument('--api-workers', type=int, default=8, help='并发请求 GitLab API 的线程数，默认为8')
+    parser.add_argument('--depth', type=int, help='浅克隆，只下载最近 N 个提交')
+    parser.add_argument('--filter', dest='blob_filter', help='部分克隆，例如 blob:none 按需下载文件内容')
+    parser.add_argument('--reference', help='共享对象缓存（裸仓库）路径，不存在时自动创建并填充')
+    parser.add_argument('--deepen', nargs='?', type=int, const=0, metavar='N',
+                        help='补全已克隆仓库的历史：指定 N 时加深 N 个提交，不指定时补全全部历史')
+    args = parser.parse_args()
+
     # 从环境变量或配置文件中读取参数（推荐方式）
     gitlab_url = os.getenv('GITLAB_URL', 'https://gitlab.com')
     group_id = os.getenv('GROUP_ID')  # 必须设置
     api_token = os.getenv('GITLAB_TOKEN')  # 必须设置
     clone_dir = os.getenv('CLONE_DIR', './repositories')  # 克隆目标目录
 
-    # 获取仓库列表（与之前代码一致）
-    url = f"{gitlab_url}/api/v4/groups/{group_id}/projects"
-    headers = {
-        "Authorization": f"Bearer {api_token}",
-        "Content-Type": "application/json"
-    }
-    params = {
-        "per_page": 100  # 根据需要调整分页大小
-    }
-
-    all_projects = []
-    page = 1
-    while True:
-        response = requests.get(url, headers=headers, params=params)
-        if response.status_code != 200:
-            print(f"Failed to fetch projects: {response.text}")
-            break
-        projects = response.json()
-        all_projects.extend(projects)
-
-        next_page = response.headers.get("X-Next-Page")
-        if not next_page:
-            break
-        page = int(next_page)
-        params["page"] = page
-
-    # 遍历仓库并克隆
+    # 补全历史只处理本地已克隆的仓库，不需要请求 GitLab
+    if args.deepen is not None:
+        print_results(deepen_repositories(clone_dir, args.deepen or None, args.workers))
+        return
+
+    # 获取仓库列表：复用连接，并发分页，递归子 Group，ETag 缓存
+    cache = ResponseCache(os.getenv('GITLAB_CACHE', os.path.join(clone_dir, '.gitlab_cache.json')))
+    os.makedirs(clone_dir, exist_ok=True)
+    session = create_session(api_token, args.api_workers)
+    try:
+        root_group, _ = get_page(session, f"{gitlab_url}/api/v4/groups/{group_id}", {"with_projects": "false"})
+        all_projects = list_group_projects(session, gitlab_url, group_id, cache, args.api_workers)
+    except requests.RequestException as e:
+        print(f"Failed to fetch projects: {e}")
+        return
+    finally:
+        session.close()
+    cache.save()
+    print(f"Found {len(all_projects)} projects")
+
+    # 整理需要同步的仓库
+    repos = []
     for project in all_projects:
-        name = project["name"]
+        name = project_local_name(project, root_group.get('full_path'))
         git_url = project["ssh_url_to_repo"]  # 或使用 "http_url_to_repo"
 
         # 处理 HTTPS URL 的认证（可选）
@@ -92,11 +415,13 @@ def main():
             # 构建带凭证的 URL
             git_url = f"https://{username}:{password}@{git_url.split('://')[1]}"
 
-        # 执行克隆
-        clone_success = clone_repository(git_url, name, clone_dir)
-        if not clone_success:
-            print(f"Failed to clone {name}")
+        repos.append((name, git_url))
+
+    # 并发执行克隆或更新
+    results = sync_repositories(repos, clone_dir, args.workers,
+                                depth=args.depth, blob_filter=args.blob_filter, reference=args.reference)
+    print_results(results)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,58 +1,172 @@
 from PIL import Image
+import json
 import os
-from typing import List, Tuple
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
 
+from img_index import ImageIndex
 
-def crop_images(image_paths: List[str],
-                crop_area: Tuple[int, int, int, int],
-                output_dir: str = "cropped_images") -> None:
+
+def clamp_crop_area(crop_area: Tuple[int, int, int, int],
+                    image_size: Tuple[int, int],
+                    clamp: bool = True):
     """
-    裁剪一批图片的指定区域并保存到输出目录
+    检查裁剪区域是否在图片范围内
 
     参数:
-        image_paths: 图片绝对路径的列表
         crop_area: 裁剪区域，格式为(left, upper, right, lower)
-        output_dir: 裁剪后图片的保存目录，默认为"cropped_images"
+        image_size: 图片尺寸 (width, height)
+        clamp: 超出范围时是否收缩到图片范围内，为False时直接判为无效
+
+    返回:
+        (区域, 状态, 说明)，状态为 'ok'、'clamped' 或 'invalid'，无效时区域为None
+    """
+    img_width, img_height = image_size
+    left, upper, right, lower = crop_area
+
+    out_of_bounds = left < 0 or upper < 0 or right > img_width or lower > img_height
+    if out_of_bounds:
+        if not clamp:
+            return None, 'invalid', "裁剪区域超出图片范围"
+        left, upper = max(left, 0), max(upper, 0)
+        right, lower = min(right, img_width), min(lower, img_height)
+
+    if left >= right or upper >= lower:
+        return None, 'invalid', "无效的裁剪区域"
+
+    if out_of_bounds:
+        return (left, upper, right, lower), 'clamped', f"裁剪区域超出图片范围，已收缩为 {(left, upper, right, lower)}"
+    return crop_area, 'ok', ''
+
+
+def crop_regions(templates: List[Tuple[List[str], Dict[str, Tuple[int, int, int, int]]]],
+                 output_dir: str = "cropped_images",
+                 clamp: bool = True,
+                 max_workers: int = None,
+                 index: ImageIndex = None) -> List[dict]:
+    """
+    按模板批量裁剪多个命名区域，每张图片只解码一次，各区域并行编码保存
+
+    参数:
+        templates: 模板列表，每项为 (图片路径列表, {区域名: (left, upper, right, lower)})，
+                   同一组图片共用一套区域
+        output_dir: 裁剪后图片的保存目录，输出文件名为 "{原文件名}_{区域名}{扩展名}"
+        clamp: 区域超出图片范围时收缩到图片范围内，为False时跳过该区域
+        max_workers: 编码线程数，默认为CPU核数
+        index: 图片内容索引，传入时跳过已按相同区域裁剪过的相同或近似重复的图片
+
+    返回:
+        每个区域的处理结果列表，元素为 {'image', 'region', 'status', 'output', 'message'}，
+        status 为 'saved'、'clamped'、'skipped'、'duplicate' 或 'failed'
     """
     # 创建输出目录（如果不存在）
     os.makedirs(output_dir, exist_ok=True)
 
-    for img_path in image_paths:
+    workers = max_workers or os.cpu_count() or 1
+    report = []
+    pending = deque()
+    # 已提交保存、尚未记入索引的图片 [(图片路径, 命名空间, 区域结果, 保存任务), ...]
+    unmarked = deque()
+
+    def mark_saved(wait):
+        """所有区域都保存成功的图片才记入索引；wait 为 False 时只处理保存已完成的图片"""
+        while unmarked and (wait or all(f.done() for f in unmarked[0][3])):
+            img_path, namespace, records, futures = unmarked.popleft()
+            for future in futures:
+                future.result()
+            if all(record['status'] != 'failed' for record in records):
+                index.mark_processed(img_path, namespace)
+
+    def save(cropped_img, output_path, record):
         try:
-            # 检查文件是否存在
-            if not os.path.exists(img_path):
-                print(f"警告: 文件不存在 - {img_path}")
-                continue
-
-            # 打开图片
-            with Image.open(img_path) as img:
-                # 检查裁剪区域是否有效
-                img_width, img_height = img.size
-                left, upper, right, lower = crop_area
-
-                if left < 0 or upper < 0 or right > img_width or lower > img_height:
-                    print(f"警告: 裁剪区域超出图片范围 - {img_path}")
+            cropped_img.save(output_path)
+            print(f"已保存: {output_path}")
+        except Exception as e:
+            record.update(status='failed', message=str(e))
+            print(f"保存 {output_path} 时出错: {str(e)}")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for image_paths, regions in templates:
+            for img_path in image_paths:
+                # 检查文件是否存在
+                if not os.path.exists(img_path):
+                    print(f"警告: 文件不存在 - {img_path}")
+                    report.extend({'image': img_path, 'region': name, 'status': 'skipped',
+                                   'output': None, 'message': "文件不存在"} for name in regions)
                     continue
 
-                if left >= right or upper >= lower:
-                    print(f"警告: 无效的裁剪区域 - {img_path}")
+                namespace = f"img_cropper:{os.path.abspath(output_dir)}:{json.dumps(regions, sort_keys=True)}"
+                if index is not None and not index.should_process(img_path, namespace):
+                    report.extend({'image': img_path, 'region': name, 'status': 'duplicate',
+                                   'output': None, 'message': "已处理过"} for name in regions)
                     continue
 
-                # 裁剪图片
-                cropped_img = img.crop(crop_area)
+                name, ext = os.path.splitext(os.path.basename(img_path))
+                records = []
+                futures = []
+                try:
+                    # 打开并完整解码一次，之后所有区域都从内存中裁剪
+                    with Image.open(img_path) as img:
+                        img.load()
+                        for region_name, crop_area in regions.items():
+                            area, state, message = clamp_crop_area(crop_area, img.size, clamp)
+                            record = {'image': img_path, 'region': region_name, 'output': None,
+                                      'status': 'clamped' if state == 'clamped' else 'saved',
+                                      'message': message}
+                            report.append(record)
+                            records.append(record)
+                            if area is None:
+                                record['status'] = 'skipped'
+                                print(f"警告: {message} - {img_path} [{region_name}]")
+                                continue
+                            if state == 'clamped':
+                                print(f"警告: {message} - {img_path} [{region_name}]")
 
-                # 生成输出文件名
-                file_name = os.path.basename(img_path)
-                name, ext = os.path.splitext(file_name)
-                output_name = f"{name}_cropped{ext}"
-                output_path = os.path.join(output_dir, output_name)
+                            output_path = os.path.join(output_dir, f"{name}_{region_name}{ext}")
+                            record['output'] = output_path
+                            futures.append(executor.submit(save, img.crop(area), output_path, record))
+                            pending.append(futures[-1])
+                            # 限制待编码的区域数量，避免解码快于编码时内存堆积
+                            if len(pending) >= workers * 2:
+                                pending.popleft().result()
+                    if index is not None:
+                        unmarked.append((img_path, namespace, records, futures))
+                        mark_saved(wait=False)
+                except Exception as e:
+                    print(f"处理 {img_path} 时出错: {str(e)}")
+                    report.append({'image': img_path, 'region': None, 'status': 'failed',
+                                   'output': None, 'message': str(e)})
+        while pending:
+            pending.popleft().result()
+        if index is not None:
+            mark_saved(wait=True)
 
-                # 保存裁剪后的图片
-                cropped_img.save(output_path)
-                print(f"已保存: {output_path}")
+    return report
 
-        except Exception as e:
-            print(f"处理 {img_path} 时出错: {str(e)}")
+
+def load_crop_templates(template_path: str):
+    """
+    从JSON文件读取裁剪模板，格式为:
+        [{"images": ["/path/a.png", ...], "regions": {"header": [0, 0, 1360, 230], ...}}, ...]
+    """
+    with open(template_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return [(item['images'], {name: tuple(area) for name, area in item['regions'].items()}) for item in data]
+
+
+def crop_images(image_paths: List[str],
+                crop_area: Tuple[int, int, int, int],
+                output_dir: str = "cropped_images") -> None:
+    """
+    裁剪一批图片的指定区域并保存到输出目录
+
+    参数:
+        image_paths: 图片绝对路径的列表
+        crop_area: 裁剪区域，格式为(left, upper, right, lower)
+        output_dir: 裁剪后图片的保存目录，默认为"cropped_images"
+    """
+    crop_regions([(image_paths, {'cropped': crop_area})], output_dir, clamp=False)
 
 
 if __name__ == "__main__":
@@ -72,3 +186,9 @@ if __name__ == "__main__":
             crop_images(example_image_paths, example_crop_area)
         else:
             print("请在example_image_paths中添加图片路径以运行示例")
+
+        # 多区域模板：每张图片解码一次，裁剪出所有命名区域
+        # crop_regions([(example_image_paths, {
+        #     'header': (0, 0, 1360, 230),
+        #     'tabs': (0, 230, 1360, 330),
+        # })])
@@ -0,0 +1,307 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+"""
+图片内容索引，供 img_resizer / img_split / img_cropper / img_pipeline 共用
+
+记录每个源文件的内容哈希（SHA-256）和感知哈希（dHash、pHash），以及各工具（按命名空间区分）
+已经处理过哪些内容：
+- 内容完全相同的文件（包括改名后的副本）直接跳过
+- 感知哈希的汉明距离在阈值内的近似重复图片跳过
+- 文件名不变但内容变化的文件重新处理
+"""
+
+DEFAULT_INDEX_PATH = os.getenv('IMG_INDEX_PATH', os.path.expanduser('~/.img_index.sqlite'))
+
+# 近似重复判定的默认汉明距离阈值（64位哈希）
+DEFAULT_MAX_DISTANCE = 4
+
+
+def _dct_matrix(n):
+    """DCT-II 变换矩阵"""
+    k = np.arange(n)
+    matrix = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+DCT_32 = _dct_matrix(32)
+
+
+def _bits_to_int(bits):
+    """64 个布尔值转为无符号 64 位整数"""
+    return int.from_bytes(np.packbits(bits.astype(np.uint8)).tobytes(), 'big')
+
+
+def perceptual_hashes(file_path):
+    """
+    计算图片的 dHash 和 pHash，JPEG 以低分辨率解码，只需要很少的像素
+
+    返回:
+    (dhash, phash): 两个 64 位无符号整数
+    """
+    with Image.open(file_path) as img:
+        img.draft('L', (64, 64))
+        gray = img.convert('L')
+        small = np.asarray(gray.resize((9, 8), Image.Resampling.BILINEAR), dtype=np.int16)
+        dhash = _bits_to_int(small[:, 1:] > small[:, :-1])
+
+        pixels = np.asarray(gray.resize((32, 32), Image.Resampling.BILINEAR), dtype=np.float64)
+        low = (DCT_32 @ pixels @ DCT_32.T)[:8, :8].flatten()
+        # 中位数不计入直流分量
+        phash = _bits_to_int(low > np.median(low[1:]))
+    return dhash, phash
+
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    """分块计算文件的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _to_signed(value):
+    """sqlite 的 INTEGER 是有符号 64 位，存储前转换"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _to_unsigned(values):
+    return np.array(values, dtype=np.int64).view(np.uint64)
+
+
+class ImageIndex:
+    """
+    持久化的图片内容索引
+
+    用法:
+        index = ImageIndex()
+        status, matched = index.check(path, namespace)
+        if status in ('new', 'changed'):
+            ...  # 处理图片
+            index.mark_processed(path, namespace)
+    """
+
+    def __init__(self, index_path=DEFAULT_INDEX_PATH, max_distance=DEFAULT_MAX_DISTANCE):
+        self.index_path = index_path
+        self.max_distance = max_distance
+        self.conn = sqlite3.connect(index_path)
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER, mtime_ns INTEGER,
+                sha256 TEXT, dhash INTEGER, phash INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS processed (
+                namespace TEXT, sha256 TEXT, path TEXT,
+                dhash INTEGER, phash INTEGER, processed_at REAL,
+                PRIMARY KEY (namespace, sha256)
+            );
+        ''')
+        # 每个命名空间的哈希数组缓存，用于向量化的汉明距离查找
+        self._hash_cache = {}
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _cached_file(self, path, stat):
+        row = self.conn.execute('SELECT size, mtime_ns, sha256, dhash, phash FROM files WHERE path = ?',
+                                (path,)).fetchone()
+        if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return row[2], row[3], row[4]
+        return None
+
+    def file_hashes(self, path):
+        """
+        返回文件的 (sha256, dhash, phash)，文件大小和修改时间未变时直接使用缓存
+        dhash/phash 以有符号整数返回（与库中存储一致）
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        cached = self._cached_file(path, stat)
+        if cached:
+            return cached
+        return self._store_file(path, stat, *self._compute(path))
+
+    @staticmethod
+    def _compute(path):
+        dhash, phash = perceptual_hashes(path)
+        return file_sha256(path), _to_signed(dhash), _to_signed(phash)
+
+    def _store_file(self, path, stat, sha256, dhash, phash):
+        self.conn.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)',
+                          (path, stat.st_size, stat.st_mtime_ns, sha256, dhash, phash))
+        return sha256, dhash, phash
+
+    def prefetch(self, paths, max_workers=None):
+        """
+        在线程池中批量计算尚未缓存的哈希（解码与 SHA-256 计算都会释放 GIL）
+        """
+        todo = []
+        for path in paths:
+            path = os.path.abspath(path)
+            stat = os.stat(path)
+            if not self._cached_file(path, stat):
+                todo.append((path, stat))
+        if not todo:
+            return
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for (path, stat), hashes in zip(todo, executor.map(lambda t: self._compute(t[0]), todo)):
+                self._store_file(path, stat, *hashes)
+        self.conn.commit()
+
+    def _namespace_hashes(self, namespace):
+        if namespace not in self._hash_cache:
+            rows = self.conn.execute('SELECT path, dhash, phash FROM processed WHERE namespace = ?',
+                                     (namespace,)).fetchall()
+            self._hash_cache[namespace] = (
+                [row[0] for row in rows],
+                _to_unsigned([row[1] for row in rows]),
+                _to_unsigned([row[2] for row in rows]),
+            )
+        return self._hash_cache[namespace]
+
+    def find_similar(self, dhash, phash, namespace):
+        """
+        查找命名空间内 dHash 和 pHash 的汉明距离都不超过阈值的已处理图片
+
+        返回:
+        list: [(路径, dHash 距离, pHash 距离), ...]，按距离从小到大排列
+        """
+        paths, dhashes, phashes = self._namespace_hashes(namespace)
+        if not paths:
+            return []
+        d_dist = np.bitwise_count(dhashes ^ _to_unsigned([dhash])[0])
+        p_dist = np.bitwise_count(phashes ^ _to_unsigned([phash])[0])
+        matched = np.nonzero((d_dist <= self.max_distance) & (p_dist <= self.max_distance))[0]
+        result = [(paths[i], int(d_dist[i]), int(p_dist[i])) for i in matched]
+        return sorted(result, key=lambda r: r[1] + r[2])
+
+    def check(self, path, namespace):
+        """
+        判断图片在某个命名空间下是否需要处理
+
+        返回:
+        (status, matched_path)，status 为:
+          'unchanged'      同一路径、同一内容已处理过
+          'duplicate'      内容完全相同的其他文件已处理过
+          'near_duplicate' 感知哈希相近的其他图片已处理过
+          'changed'        该路径处理过，但内容已变化
+          'new'            未处理过
+        """
+        path = os.path.abspath(path)
+        sha256, dhash, phash = self.file_hashes(path)
+
+        row = self.conn.execute('SELECT path FROM processed WHERE namespace = ? AND sha256 = ?',
+                                (namespace, sha256)).fetchone()
+        if row:
+            return ('unchanged' if row[0] == path else 'duplicate'), row[0]
+
+        if self.max_distance is not None:
+            similar = [s for s in self.find_similar(dhash, phash, namespace) if s[0] != path]
+            if similar:
+                return 'near_duplicate', similar[0][0]
+
+        row = self.conn.execute('SELECT 1 FROM processed WHERE namespace = ? AND path = ?',
+                                (namespace, path)).fetchone()
+        return ('changed' if row else 'new'), None
+
+    def should_process(self, path, namespace):
+        """check 的简化版本：需要处理时返回 True，否则打印跳过原因并返回 False"""
+        status, matched = self.check(path, namespace)
+        if status in ('new', 'changed'):
+            return True
+        reason = {'unchanged': '已处理过', 'duplicate': '与已处理文件内容相同',
+                  'near_duplicate': '与已处理图片近似重复'}[status]
+        print(f"跳过{reason}的文件: {path}" + (f" ({matched})" if matched and matched != os.path.abspath(path) else ''))
+        return False
+
+    def select(self, paths, namespace, skip_unchanged=True):
+        """
+        批量筛选需要处理的图片：除了与已处理记录比较，同一批次内相同或近似重复的图片也只保留第一张
+
+        参数:
+        skip_unchanged: 是否跳过同一路径、同一内容已处理过的图片
+
+        返回:
+        list: 需要处理的图片路径（保持原顺序）
+        """
+        self.prefetch(paths)
+        skip_status = {'duplicate', 'near_duplicate'} | ({'unchanged'} if skip_unchanged else set())
+        selected = []
+        batch_sha = {}
+        batch_paths, batch_dhashes, batch_phashes = [], [], []
+        for path in paths:
+            status, matched = self.check(path, namespace)
+            sha256, dhash, phash = self.file_hashes(path)
+            if status not in skip_status:
+                if sha256 in batch_sha:
+                    status, matched = 'duplicate', batch_sha[sha256]
+                elif self.max_distance is not None and batch_paths:
+                    d_dist = np.bitwise_count(_to_unsigned(batch_dhashes) ^ _to_unsigned([dhash])[0])
+                    p_dist = np.bitwise_count(_to_unsigned(batch_phashes) ^ _to_unsigned([phash])[0])
+                    close = np.nonzero((d_dist <= self.max_distance) & (p_dist <= self.max_distance))[0]
+                    if len(close):
+                        status, matched = 'near_duplicate', batch_paths[close[0]]
+            if status in skip_status:
+                print(f"跳过 {status}: {path}" + (f" ({matched})" if matched else ''))
+                continue
+            selected.append(path)
+            batch_sha[sha256] = path
+            batch_paths.append(path)
+            batch_dhashes.append(dhash)
+            batch_phashes.append(phash)
+        return selected
+
+    def mark_processed(self, path, namespace):
+        """记录图片在命名空间下已处理，同一路径的旧内容记录会被替换"""
+        path = os.path.abspath(path)
+        sha256, dhash, phash = self.file_hashes(path)
+        self.conn.execute('DELETE FROM processed WHERE namespace = ? AND path = ?', (namespace, path))
+        self.conn.execute('INSERT OR REPLACE INTO processed VALUES (?, ?, ?, ?, ?, ?)',
+                          (namespace, sha256, path, dhash, phash, time.time()))
+        self.conn.commit()
+        self._hash_cache.pop(namespace, None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='查找目录中内容相同或近似重复的图片')
+    parser.add_argument('--input', required=True, help='输入图片目录')
+    parser.add_argument('--index', default=DEFAULT_INDEX_PATH, help='索引文件路径')
+    parser.add_argument('--max-distance', type=int, default=DEFAULT_MAX_DISTANCE, help='近似重复的汉明距离阈值')
+
+    args = parser.parse_args()
+    supported_formats = {'.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tiff'}
+    paths = [os.path.join(args.input, name) for name in sorted(os.listdir(args.input))
+             if os.path.splitext(name)[1].lower() in supported_formats]
+
+    # 用临时命名空间逐个登记，每张图片与之前的图片比较
+    namespace = f"scan:{os.path.abspath(args.input)}:{time.time()}"
+    with ImageIndex(args.index, args.max_distance) as index:
+        index.prefetch(paths)
+        for path in paths:
+            status, matched = index.check(path, namespace)
+            if status in ('duplicate', 'near_duplicate'):
+                print(f"{status}: {path} -> {matched}")
+            else:
+                index.mark_processed(path, namespace)
+        index.conn.execute('DELETE FROM processed WHERE namespace = ?', (namespace,))
+
+
+if __name__ == "__main__":
+    main()
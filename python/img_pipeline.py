@@ -0,0 +1,196 @@
+import argparse
+import json
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from PIL import Image
+
+from img_cropper import clamp_crop_area
+from img_index import DEFAULT_INDEX_PATH, ImageIndex
+from img_resizer import DRAFT_MAX_SCALE
+from img_split import OUTPUT_EXTENSIONS, encode_pillow
+
+"""
+图片处理流水线：裁剪 → 缩放 → 切割 → 编码
+
+各步骤都在内存中的图像上执行，开始时只解码一次，结束时只编码一次，
+避免 img_cropper / img_resizer / img_split 串联时每一步都落盘并重新编码
+
+步骤用 JSON 描述，例如:
+    [{"op": "crop", "box": [0, 0, 1360, 2000]},
+     {"op": "resize", "scale": 0.5},
+     {"op": "split", "height": 750}]
+"""
+
+SUPPORTED_FORMATS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tiff'}
+
+
+def step_crop(images, box, clamp=True):
+    """裁剪，区域超出范围时按 clamp 收缩，无法收缩时报错"""
+    results = []
+    for img in images:
+        area, _, message = clamp_crop_area(tuple(box), img.size, clamp)
+        if area is None:
+            raise ValueError(message)
+        results.append(img.crop(area))
+    return results
+
+
+def step_resize(images, scale=None, width=None, reducing_gap=3.0):
+    """缩放，指定 scale 按比例缩放，指定 width 按宽度等比缩放"""
+    results = []
+    for img in images:
+        factor = scale if scale is not None else width / img.width
+        size = (max(1, int(img.width * factor)), max(1, int(img.height * factor)))
+        results.append(img.resize(size, Image.Resampling.LANCZOS, reducing_gap=reducing_gap))
+    return results
+
+
+def step_split(images, height):
+    """按高度切割，一张图变为多张"""
+    results = []
+    for img in images:
+        for top in range(0, img.height, height):
+            results.append(img.crop((0, top, img.width, min(top + height, img.height))))
+    return results
+
+
+STEPS = {
+    'crop': step_crop,
+    'resize': step_resize,
+    'split': step_split,
+}
+
+
+def load_steps(text):
+    """读取步骤配置，参数可以是 JSON 文件路径或 JSON 文本"""
+    if os.path.isfile(text):
+        with open(text, 'r', encoding='utf-8') as f:
+            steps = json.load(f)
+    else:
+        steps = json.loads(text)
+    for step in steps:
+        if step.get('op') not in STEPS:
+            raise ValueError(f"不支持的步骤: {step.get('op')}")
+    return steps
+
+
+def run_pipeline(src_file_path, output_dir, steps, fmt='png', png_compression=6, quality=90):
+    """
+    对单张图片执行流水线（进程池任务，需为模块级函数）
+
+    返回:
+    (list, dict, str): 输出文件路径、各阶段耗时（秒）、错误信息（成功时为空）
+    """
+    timings = {}
+    outputs = []
+    try:
+        started = time.perf_counter()
+        with Image.open(src_file_path) as img:
+            # 第一步就是缩小时，JPEG 直接以低分辨率解码
+            first = steps[0] if steps else {}
+            if img.format == 'JPEG' and first.get('op') == 'resize' and first.get('scale', 1) <= DRAFT_MAX_SCALE:
+                target_width = max(1, int(img.width * first['scale']))
+                # 直接按目标尺寸 draft，reducing_gap 只用于之后的 LANCZOS 缩放（见 img_resizer.resize_variants）
+                img.draft(img.mode, (target_width, max(1, int(img.height * first['scale']))))
+                # 解码尺寸已经变小，缩放比例改为按原图计算的目标宽度
+                rewritten = {key: value for key, value in first.items() if key != 'scale'}
+                rewritten['width'] = target_width
+                steps = [rewritten] + list(steps[1:])
+            img.load()
+            images = [img.copy()]
+        timings['decode'] = time.perf_counter() - started
+
+        for i, step in enumerate(steps):
+            started = time.perf_counter()
+            params = {k: v for k, v in step.items() if k != 'op'}
+            images = STEPS[step['op']](images, **params)
+            timings[f"{i + 1}.{step['op']}"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        stem = Path(src_file_path).stem
+        for n, image in enumerate(images, 1):
+            suffix = f"_{n}" if len(images) > 1 else ''
+            output_path = os.path.join(output_dir, f"{stem}{suffix}{OUTPUT_EXTENSIONS[fmt]}")
+            encode_pillow(image, output_path, fmt, png_compression, quality)
+            outputs.append(output_path)
+        timings['encode'] = time.perf_counter() - started
+        return outputs, timings, ''
+    except Exception as e:
+        return outputs, timings, str(e)
+
+
+def run_pipeline_batch(input_path, output_dir, steps, fmt='png', png_compression=6, quality=90, max_workers=None,
+                       index=None):
+    """
+    对单个文件或整个目录执行流水线，目录下的图片分发到进程池并行处理，结束时打印各阶段耗时汇总
+    传入 index（ImageIndex）时跳过已按相同配置处理过的相同或近似重复的图片
+
+    返回:
+    list: 所有输出文件路径
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if os.path.isdir(input_path):
+        files = [os.path.join(input_path, name) for name in sorted(os.listdir(input_path))
+                 if Path(name).suffix.lower() in SUPPORTED_FORMATS]
+    else:
+        files = [input_path]
+
+    namespace = f"img_pipeline:{os.path.abspath(output_dir)}:{json.dumps(steps, sort_keys=True)}:{fmt}"
+    if index is not None:
+        files = index.select(files, namespace)
+
+    started = time.perf_counter()
+    total_timings = defaultdict(float)
+    all_outputs = []
+    failed = 0
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(run_pipeline, files, [output_dir] * len(files), [steps] * len(files),
+                               [fmt] * len(files), [png_compression] * len(files), [quality] * len(files))
+        for i, (file_path, (outputs, timings, error)) in enumerate(zip(files, results), 1):
+            for stage, seconds in timings.items():
+                total_timings[stage] += seconds
+            all_outputs.extend(outputs)
+            if error:
+                failed += 1
+                print(f"[{i}/{len(files)}] 处理 {file_path} 时出错: {error}")
+            else:
+                print(f"[{i}/{len(files)}] 已处理: {file_path} -> {len(outputs)}张")
+                if index is not None:
+                    index.mark_processed(file_path, namespace)
+
+    print(f"完成: {len(files) - failed}/{len(files)} 张图片, 输出 {len(all_outputs)} 张, "
+          f"总耗时 {time.perf_counter() - started:.2f}s")
+    print("各阶段累计耗时（所有进程合计）:")
+    for stage, seconds in total_timings.items():
+        print(f"  {stage:<12} {seconds:>8.2f}s")
+    return all_outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='图片处理流水线：一次解码，依次裁剪/缩放/切割，一次编码')
+    parser.add_argument('--input', required=True, help='输入图片路径或目录')
+    parser.add_argument('--output', required=True, help='输出图片目录')
+    parser.add_argument('--steps', required=True, help='步骤配置，JSON 文件路径或 JSON 文本')
+    parser.add_argument('--format', choices=list(OUTPUT_EXTENSIONS), default='png', help='输出格式，默认为png')
+    parser.add_argument('--png-compression', type=int, default=6, help='PNG 压缩级别 0-9，默认为6')
+    parser.add_argument('--quality', type=int, default=90, help='WebP/JPEG 质量 1-100，默认为90')
+    parser.add_argument('--workers', type=int, help='进程数，默认为CPU核数')
+    parser.add_argument('--index', nargs='?', const=DEFAULT_INDEX_PATH,
+                        help='使用图片内容索引跳过已处理过的相同或近似重复的图片，可指定索引文件路径')
+
+    args = parser.parse_args()
+    index = ImageIndex(args.index) if args.index else None
+    try:
+        run_pipeline_batch(args.input, args.output, load_steps(args.steps), args.format,
+                           args.png_compression, args.quality, args.workers, index)
+    finally:
+        if index is not None:
+            index.close()
+
+
+if __name__ == "__main__":
+    main()
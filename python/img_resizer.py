@@ -1,10 +1,105 @@
+import itertools
+import json
 import os
+from concurrent.futures import ProcessPoolExecutor
 from PIL import Image
 from pathlib import Path
 import argparse
 
+from img_index import DEFAULT_INDEX_PATH, ImageIndex
 
-def resize_images(input_dir, output_dir, scale_factor=0.5):
+
+# JPEG 可在解码时按 1/2、1/4、1/8 做 DCT 缩放，最大的缩放因子不大于该值时按目标尺寸启用 draft
+DRAFT_MAX_SCALE = 0.5
+
+# 输出目录中记录每张源图已生成哪些尺寸的清单
+MANIFEST_NAME = '.resize_manifest.json'
+
+
+def parse_variants(text):
+    """
+    解析输出尺寸配置，例如 "@1x=0.25,@2x=0.5"
+
+    返回:
+    list: [(后缀, 缩放因子), ...]
+    """
+    variants = []
+    for item in text.split(','):
+        suffix, scale = item.split('=')
+        variants.append((suffix.strip(), float(scale)))
+    return variants
+
+
+def resize_variants(file_path, outputs, reducing_gap=3.0):
+    """
+    解码一次源图，按缩放因子从大到小逐级缩小，依次输出各尺寸、各格式（进程池任务，需为模块级函数）
+
+    参数:
+    file_path (str): 源图路径
+    outputs (list): [(缩放因子, [输出路径, ...]), ...]
+    reducing_gap (float): 缩放时先用 reduce 快速缩小的阈值，越大质量越好、速度越慢
+
+    返回:
+    (list, str): 成功生成的输出路径、处理结果说明
+    """
+    filename = os.path.basename(file_path)
+    outputs = sorted(outputs, key=lambda o: o[0], reverse=True)
+    produced = []
+    try:
+        # 打开图片
+        with Image.open(file_path) as img:
+            # 获取原始尺寸
+            width, height = img.size
+            sizes = [(max(1, int(width * scale)), max(1, int(height * scale))) for scale, _ in outputs]
+
+            # JPEG 直接以低分辨率解码，draft 选择解码结果不小于最大目标尺寸的最小 DCT 缩放，
+            # 不留 reducing_gap 余量（否则缩放 0.5 时余量超过原图，draft 不生效），剩余部分由 LANCZOS 完成
+            if img.format == 'JPEG' and outputs[0][0] <= DRAFT_MAX_SCALE:
+                img.draft(img.mode, sizes[0])
+
+            # 逐级缩小：每一级都从上一级的结果继续缩小，只有第一级处理完整分辨率
+            current = img
+            for size, (_, output_paths) in zip(sizes, outputs):
+                if current.size != size:
+                    # reducing_gap 先做整数倍快速缩小，再用 LANCZOS 完成剩余部分
+                    current = current.resize(size, Image.Resampling.LANCZOS, reducing_gap=reducing_gap)
+                for output_path in output_paths:
+                    save_image(current, output_path)
+                    produced.append(output_path)
+
+            size_desc = ', '.join(f"{w}x{h}" for w, h in sizes)
+            return produced, f"已调整: {filename} ({width}x{height} -> {size_desc})"
+    except Exception as e:
+        return produced, f"处理文件 {filename} 时出错: {str(e)}"
+
+
+def save_image(img, output_path):
+    """按输出文件扩展名保存，不支持透明通道的格式先转为RGB"""
+    ext = Path(output_path).suffix.lower()
+    if ext in ('.jpg', '.jpeg', '.bmp') and img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    img.save(output_path)
+
+
+def load_manifest(manifest_path):
+    """读取清单，不存在或损坏时返回空清单"""
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_manifest(manifest_path, manifest):
+    """先写临时文件再替换，避免中断时留下损坏的清单"""
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def resize_images(input_dir, output_dir, scale_factor=0.5, max_workers=None, reducing_gap=3.0,
+                  variants=None, formats=None, index=None):
     """
     调整目录中所有图片的尺寸
 
@@ -12,6 +107,11 @@ def resize_images(input_dir, output_dir, scale_factor=0.5):
     input_dir (str): 输入图片目录
     output_dir (str): 输出图片目录
     scale_factor (float): 缩放因子，默认为0.5（即缩小为原图的一半）
+    max_workers (int): 进程数，默认为CPU核数
+    reducing_gap (float): 缩放时先用 reduce 快速缩小的阈值，越大质量越好、速度越慢
+    variants (list): 输出尺寸 [(后缀, 缩放因子), ...]，默认只输出 [('@2x', scale_factor)]
+    formats (list): 输出格式扩展名，例如 ['.png', '.webp']，默认与源图一致
+    index (ImageIndex): 图片内容索引，传入时跳过与已处理图片内容相同或近似重复的源图
     """
     # 创建输出目录（如果不存在）
     os.makedirs(output_dir, exist_ok=True)
@@ -19,16 +119,15 @@ def resize_images(input_dir, output_dir, scale_factor=0.5):
     # 支持的图片格式
     supported_formats = {'.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tiff'}
 
-    # 获取输出目录中已存在的带@2x后缀的图片
-    existing_output_files = set()
-    for filename in os.listdir(output_dir):
-        if '@2x' in filename:
-            # 提取原始文件名（不包含@2x和扩展名）
-            base_name = filename.split('@2x')[0]
-            existing_output_files.add(base_name.lower())
+    variants = variants or [('@2x', scale_factor)]
+
+    # 清单按源文件记录其大小、修改时间和已生成的输出文件，源文件变化后全部重新生成
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
 
-    # 遍历输入目录中的所有文件
-    for filename in os.listdir(input_dir):
+    # 遍历输入目录中的所有文件，收集每张图片缺少的输出
+    tasks = []
+    for filename in sorted(os.listdir(input_dir)):
         file_path = os.path.join(input_dir, filename)
 
         # 检查是否为文件且为支持的图片格式
@@ -37,37 +136,60 @@ def resize_images(input_dir, output_dir, scale_factor=0.5):
             if file_ext in supported_formats:
                 # 提取文件名（不包含扩展名）
                 base_name = Path(filename).stem
-
-                # 检查是否已存在处理过的文件
-                if base_name.lower() in existing_output_files:
+                stat = os.stat(file_path)
+                signature = [stat.st_size, stat.st_mtime_ns]
+                entry = manifest.get(filename)
+                done = set(entry['outputs']) if entry and entry['source'] == signature else set()
+
+                outputs = []
+                for suffix, scale in variants:
+                    output_paths = []
+                    for ext in formats or [file_ext]:
+                        # 构建输出文件名（添加尺寸后缀）
+                        new_filename = f"{base_name}{suffix}{ext}"
+                        output_path = os.path.join(output_dir, new_filename)
+                        # 没有清单记录时沿用旧规则：同名输出已存在即视为处理过
+                        if entry is None and os.path.exists(output_path):
+                            continue
+                        if new_filename in done and os.path.exists(output_path):
+                            continue
+                        output_paths.append(output_path)
+                    if output_paths:
+                        outputs.append((scale, output_paths))
+
+                if not outputs:
                     print(f"跳过已处理的文件: {filename}")
                     continue
+                tasks.append((filename, signature, file_path, outputs))
+            else:
+                print(f"跳过非图片文件: {filename}")
 
-                try:
-                    # 打开图片
-                    with Image.open(file_path) as img:
-                        # 获取原始尺寸
-                        width, height = img.size
-
-                        # 计算新尺寸
-                        new_width = int(width * scale_factor)
-                        new_height = int(height * scale_factor)
-
-                        # 调整尺寸
-                        resized_img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-
-                        # 构建输出文件名（添加@2x后缀）
-                        new_filename = f"{base_name}@2x{file_ext}"
-                        output_path = os.path.join(output_dir, new_filename)
+    # 同一输出目录、同一组输出配置共用一个命名空间
+    namespace = f"img_resizer:{os.path.abspath(output_dir)}:{variants}:{formats}"
+    if index is not None and tasks:
+        # 同一文件缺少的输出由清单决定，索引只负责跳过其他文件的重复内容
+        selected = set(index.select([t[2] for t in tasks], namespace, skip_unchanged=False))
+        tasks = [t for t in tasks if t[2] in selected]
 
-                        # 保存图片，保留原始格式
-                        resized_img.save(output_path)
+    if not tasks:
+        return
 
-                        print(f"已调整: {filename} ({width}x{height} -> {new_width}x{new_height})")
-                except Exception as e:
-                    print(f"处理文件 {filename} 时出错: {str(e)}")
-            else:
-                print(f"跳过非图片文件: {filename}")
+    # 多进程处理，map 按提交顺序返回结果，进度输出保持有序
+    total = len(tasks)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(resize_variants, [t[2] for t in tasks], [t[3] for t in tasks],
+                               itertools.repeat(reducing_gap), chunksize=4)
+        for i, ((filename, signature, _, _), (produced, message)) in enumerate(zip(tasks, results), 1):
+            print(f"[{i}/{total}] {message}")
+            entry = manifest.get(filename)
+            if not entry or entry['source'] != signature:
+                entry = manifest[filename] = {'source': signature, 'outputs': []}
+            entry['outputs'] = sorted(set(entry['outputs']) | {os.path.basename(p) for p in produced})
+            if index is not None and produced:
+                index.mark_processed(os.path.join(input_dir, filename), namespace)
+            if i % 50 == 0:
+                save_manifest(manifest_path, manifest)
+    save_manifest(manifest_path, manifest)
 
 
 def main():
@@ -75,19 +197,31 @@ def main():
     parser.add_argument('--input', required=True, help='输入图片目录')
     parser.add_argument('--output', required=True, help='输出图片目录')
     parser.add_argument('--scale', type=float, default=0.5, help='缩放因子，默认为0.5')
+    parser.add_argument('--workers', type=int, help='进程数，默认为CPU核数')
+    parser.add_argument('--variants', help='一次输出多个尺寸，例如 "@1x=0.333,@2x=0.667,@3x=1"，指定后忽略--scale')
+    parser.add_argument('--formats', help='输出格式，例如 "png,webp"，默认与源图一致')
+    parser.add_argument('--index', nargs='?', const=DEFAULT_INDEX_PATH,
+                        help='使用图片内容索引跳过重复和近似重复的图片，可指定索引文件路径')
 
     args = parser.parse_args()
     input_d = args.input
     out_d = args.output
     scale_f = args.scale
+    variants = parse_variants(args.variants) if args.variants else None
+    formats = ['.' + f.strip().lstrip('.').lower() for f in args.formats.split(',')] if args.formats else None
 
     # 验证输入目录是否存在
     if not os.path.isdir(input_d):
         print(f"错误: 输入目录 '{input_d}' 不存在")
         return
 
-    resize_images(input_d, out_d, scale_f)
+    index = ImageIndex(args.index) if args.index else None
+    try:
+        resize_images(input_d, out_d, scale_f, args.workers, variants=variants, formats=formats, index=index)
+    finally:
+        if index is not None:
+            index.close()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,11 +1,29 @@
+import itertools
 import os
+import struct
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
 
 import cv2
+import numpy as np
 from os.path import join, exists
 from os import mkdir
 from PIL import Image
 import argparse
 
+from img_index import DEFAULT_INDEX_PATH, ImageIndex
+from img_to_pdf import PNG_SIGNATURE, read_png_info
+
+# 8位深度下 PNG 各颜色类型每个像素的字节数（灰度、RGB、调色板、灰度+透明、RGBA）
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+# raw 解码器按行寻址时各 rawmode 每个像素的字节数
+RAW_MODE_BYTES = {'L': 1, 'P': 1, 'LA': 2, 'RGB': 3, 'BGR': 3, 'RGBA': 4, 'BGRA': 4,
+                  'RGBX': 4, 'BGRX': 4, 'CMYK': 4}
+
 
 def opencv_handler(src_dir, dst_dir, split_height = 1024):
     if not exists(dst_dir):
@@ -18,7 +36,7 @@ def opencv_handler(src_dir, dst_dir, split_height = 1024):
     width = shape[1]
     if height < 1420:
         print('高度不足，退出裁剪')
-        exit(0)
+        return
     offset = 0
     serial_no = 1
     while True:
@@ -50,7 +68,7 @@ def pillow_handler(src_file_path, dst_dir, split_height = 1024):
     width = shape[0]
     if height < 1420:
         print('高度不足，退出裁剪')
-        exit(0)
+        return
     offset = 0
     serial_no = 1
     while True:
@@ -64,11 +82,317 @@ def pillow_handler(src_file_path, dst_dir, split_height = 1024):
         serial_no = serial_no + 1
 
 
+def _png_chunk(chunk_type, data):
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data))
+
+
+def _iter_png_row_blocks(src_file_path, idat, block_bytes):
+    """
+    流式解压 IDAT，每次产出 block_bytes 字节的已过滤扫描行（最后一块可能更短）
+    解压输出有上限，内存占用与 block_bytes 同阶
+    """
+    decompressor = zlib.decompressobj()
+    buffer = bytearray()
+    with open(src_file_path, 'rb') as f:
+        for offset, length in idat:
+            f.seek(offset)
+            remaining = length
+            while remaining:
+                data = f.read(min(remaining, 64 * 1024))
+                remaining -= len(data)
+                while data:
+                    buffer += decompressor.decompress(data, block_bytes)
+                    data = decompressor.unconsumed_tail
+                    while len(buffer) >= block_bytes:
+                        yield bytes(buffer[:block_bytes])
+                        del buffer[:block_bytes]
+    buffer += decompressor.flush()
+    if buffer:
+        yield bytes(buffer)
+
+
+def iter_png_strips(src_file_path, split_height):
+    """
+    逐条解码 PNG，只解码当前切片需要的行，返回 (起始行, 切片图像) 的生成器
+    不支持（隔行扫描、非8位深度）时返回 None
+
+    PNG 的行过滤依赖上一行，因此把上一切片解码后的最后一行以“无过滤”方式放在当前切片前面，
+    拼成一张小 PNG 交给 Pillow 解码，再去掉这一行
+    """
+    info = read_png_info(src_file_path)
+    color_type = info['color_type']
+    if info['interlace'] or info['bit_depth'] != 8 or color_type not in PNG_CHANNELS:
+        return None
+
+    width = info['width']
+    row_bytes = 1 + width * PNG_CHANNELS[color_type]
+    extra_chunks = b''
+    if info['palette'] is not None:
+        extra_chunks += _png_chunk(b'PLTE', info['palette'])
+    if info['trns'] is not None:
+        extra_chunks += _png_chunk(b'tRNS', info['trns'])
+
+    def generate():
+        previous_row = None
+        top = 0
+        for block in _iter_png_row_blocks(src_file_path, info['idat'], row_bytes * split_height):
+            rows = len(block) // row_bytes
+            data = block[:rows * row_bytes]
+            if previous_row is not None:
+                data = b'\x00' + previous_row + data
+            height = rows + (previous_row is not None)
+            ihdr = struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0)
+            png = (PNG_SIGNATURE + _png_chunk(b'IHDR', ihdr) + extra_chunks
+                   + _png_chunk(b'IDAT', zlib.compress(data, 1)) + _png_chunk(b'IEND', b''))
+            strip = Image.open(BytesIO(png))
+            strip.load()
+            # 8位深度时解码后的像素字节即为该行去过滤后的原始数据
+            previous_row = strip.crop((0, height - 1, width, height)).tobytes()
+            if height != rows:
+                strip = strip.crop((0, 1, width, height))
+            yield top, strip
+            top += rows
+
+    return generate()
+
+
+def _band_tiles(img, top, bottom):
+    """
+    改写 Pillow 的 tile 列表，使 load() 只读取 [top, bottom) 范围的数据
+    返回 (新 tile 列表, 实际读取的起始行, 结束行)，格式不支持按行寻址时返回 None
+    """
+    width, height = img.size
+    tiles = img.tile
+    if len(tiles) > 1:
+        # 分条/分块存储（如 TIFF strips），只保留与目标范围相交的块
+        selected = [t for t in tiles if t.extents[1] < bottom and t.extents[3] > top]
+        band_top = min(t.extents[1] for t in selected)
+        band_bottom = max(t.extents[3] for t in selected)
+        return [t._replace(extents=(t.extents[0], t.extents[1] - band_top,
+                                    t.extents[2], t.extents[3] - band_top)) for t in selected], band_top, band_bottom
+
+    tile = tiles[0]
+    if tile.codec_name != 'raw' or tile.extents != (0, 0, width, height):
+        return None
+    args = tile.args if isinstance(tile.args, tuple) else (tile.args,)
+    rawmode = args[0]
+    stride = args[1] if len(args) > 1 else 0
+    orientation = args[2] if len(args) > 2 else 1
+    if not stride:
+        if rawmode not in RAW_MODE_BYTES:
+            return None
+        stride = width * RAW_MODE_BYTES[rawmode]
+    # 自底向上存储（如 BMP）时，目标范围的最后一行在文件中最靠前
+    first_row = top if orientation > 0 else height - bottom
+    return [tile._replace(extents=(0, 0, width, bottom - top), offset=tile.offset + first_row * stride)], top, bottom
+
+
+def iter_band_strips(src_file_path, split_height):
+    """
+    对支持按行寻址的格式（未压缩 TIFF/BMP/PPM 等）逐条读取，返回 (起始行, 切片图像) 的生成器
+    格式不支持时返回 None
+    """
+    with Image.open(src_file_path) as img:
+        width, height = img.size
+        if not img.tile or _band_tiles(img, 0, min(split_height, height)) is None:
+            return None
+
+    def generate():
+        for top in range(0, height, split_height):
+            bottom = min(top + split_height, height)
+            with Image.open(src_file_path) as band:
+                tiles, band_top, band_bottom = _band_tiles(band, top, bottom)
+                band.tile = tiles
+                band._size = (width, band_bottom - band_top)
+                band.load()
+                yield top, band.crop((0, top - band_top, width, bottom - band_top))
+
+    return generate()
+
+
+def iter_full_strips(src_file_path, split_height):
+    """兜底方案：完整解码后逐条裁剪"""
+    with Image.open(src_file_path) as img:
+        img.load()
+        width, height = img.size
+        for top in range(0, height, split_height):
+            yield top, img.crop((0, top, width, min(top + split_height, height)))
+
+
+def iter_strips(src_file_path, split_height):
+    """
+    按高度切片，峰值内存只与 split_height 成正比：
+    PNG 走逐行流式解码，支持按行寻址的格式走分段读取，其他格式退回完整解码
+    """
+    strips = None
+    if src_file_path.lower().endswith('.png'):
+        strips = iter_png_strips(src_file_path, split_height)
+    if strips is None:
+        strips = iter_band_strips(src_file_path, split_height)
+    if strips is None:
+        print(f"该格式不支持分段解码，将完整解码: {src_file_path}")
+        strips = iter_full_strips(src_file_path, split_height)
+    return strips
+
+
+OUTPUT_EXTENSIONS = {'png': '.png', 'webp': '.webp', 'jpg': '.jpg'}
+
+
+def encode_pillow(strip, fp, fmt='png', png_compression=6, quality=90):
+    """使用 Pillow 编码切片，fp 可以是文件路径或 BytesIO"""
+    if fmt == 'png':
+        strip.save(fp, 'PNG', compress_level=png_compression)
+    elif fmt == 'webp':
+        strip.save(fp, 'WEBP', quality=quality, method=4)
+    else:
+        if strip.mode not in ('RGB', 'L'):
+            strip = strip.convert('RGB')
+        strip.save(fp, 'JPEG', quality=quality)
+
+
+def encode_opencv(array, fmt='png', png_compression=6, quality=90):
+    """使用 OpenCV 编码切片，返回编码后的字节"""
+    if fmt == 'png':
+        params = [cv2.IMWRITE_PNG_COMPRESSION, png_compression]
+    elif fmt == 'webp':
+        params = [cv2.IMWRITE_WEBP_QUALITY, quality]
+    else:
+        params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        if array.ndim == 3 and array.shape[2] == 4:
+            array = cv2.cvtColor(array, cv2.COLOR_BGRA2BGR)
+    success, buffer = cv2.imencode(OUTPUT_EXTENSIONS[fmt], array, params)
+    if not success:
+        raise ValueError(f"OpenCV 编码失败: {fmt}")
+    return buffer.tobytes()
+
+
+def _save_opencv(array, output_path, fmt, png_compression, quality):
+    # cv2.imwrite 不支持非 ASCII 路径，先编码到内存再写文件
+    with open(output_path, 'wb') as f:
+        f.write(encode_opencv(array, fmt, png_compression, quality))
+
+
+def _pil_to_bgr(strip):
+    """PIL 图像转为 OpenCV 使用的 BGR(A) 数组"""
+    if strip.mode in ('RGBA', 'LA', 'PA') or 'transparency' in strip.info:
+        return cv2.cvtColor(np.asarray(strip.convert('RGBA')), cv2.COLOR_RGBA2BGRA)
+    return cv2.cvtColor(np.asarray(strip.convert('RGB')), cv2.COLOR_RGB2BGR)
+
+
+def choose_backend(sample, fmt='png', png_compression=6, quality=90, size_tolerance=0.1):
+    """
+    用第一张切片分别试编码，按实测速度和体积为当前图片选择后端：
+    体积不超过最小者 (1 + size_tolerance) 倍的后端中，选择编码最快的
+
+    :return: 'opencv' 或 'pillow'
+    """
+    array = _pil_to_bgr(sample)
+
+    started = time.perf_counter()
+    buffer = BytesIO()
+    encode_pillow(sample, buffer, fmt, png_compression, quality)
+    pillow_cost = (time.perf_counter() - started, buffer.tell())
+
+    started = time.perf_counter()
+    opencv_size = len(encode_opencv(array, fmt, png_compression, quality))
+    opencv_cost = (time.perf_counter() - started, opencv_size)
+
+    costs = {'pillow': pillow_cost, 'opencv': opencv_cost}
+    size_limit = min(size for _, size in costs.values()) * (1 + size_tolerance)
+    backend = min((name for name, (_, size) in costs.items() if size <= size_limit),
+                  key=lambda name: costs[name][0])
+    print(f"自动选择后端: {backend} (pillow {pillow_cost[0] * 1000:.0f}ms/{pillow_cost[1]:,}B, "
+          f"opencv {opencv_cost[0] * 1000:.0f}ms/{opencv_cost[1]:,}B)")
+    return backend
+
+
+def split_image(src_file_path, dst_dir, split_height=1024, backend='pillow', fmt='png',
+                png_compression=6, quality=90, max_workers=None, low_memory=False, min_height=1420):
+    """
+    切割长图，切片在线程池中并行编码（Pillow 与 OpenCV 的编码器都会释放 GIL）
+    输出文件命名与 pillow_handler 一致
+
+    :param backend: 'pillow'、'opencv' 或 'auto'（按实测速度和体积自动选择）
+    :param fmt: 输出格式，'png'、'webp' 或 'jpg'
+    :param png_compression: PNG 压缩级别 0-9
+    :param quality: WebP/JPEG 质量 1-100
+    :param max_workers: 编码线程数，默认为 CPU 核数
+    :param low_memory: 逐条解码（仅 pillow 后端），峰值内存只与 split_height 成正比
+    :return: 生成的文件路径列表
+    """
+    file_name = os.path.splitext(os.path.basename(src_file_path))[0]
+    dst_dir = join(dst_dir, file_name)
+    os.makedirs(dst_dir, exist_ok=True)
+
+    # 只读取文件头获取尺寸，不解码像素
+    with Image.open(src_file_path) as img:
+        width, height = img.size
+    print((width, height))
+    if height < min_height:
+        print('高度不足，退出裁剪')
+        return []
+
+    if backend == 'opencv':
+        with open(src_file_path, 'rb') as f:
+            img = cv2.imdecode(np.frombuffer(f.read(), np.uint8), cv2.IMREAD_UNCHANGED)
+        # numpy 切片是视图，不复制像素
+        strips = ((top, img[top:top + split_height]) for top in range(0, height, split_height))
+    else:
+        if low_memory:
+            strips = iter_strips(src_file_path, split_height)
+        else:
+            strips = iter_full_strips(src_file_path, split_height)
+        if backend == 'auto':
+            first = next(strips)
+            backend = choose_backend(first[1], fmt, png_compression, quality)
+            strips = itertools.chain([first], strips)
+            if backend == 'opencv':
+                strips = ((top, _pil_to_bgr(strip)) for top, strip in strips)
+
+    def save(serial_no, strip):
+        output_path = join(dst_dir, file_name + "_" + str(serial_no) + OUTPUT_EXTENSIONS[fmt])
+        if backend == 'opencv':
+            _save_opencv(strip, output_path, fmt, png_compression, quality)
+        else:
+            encode_pillow(strip, output_path, fmt, png_compression, quality)
+        return output_path
+
+    workers = max_workers or os.cpu_count() or 1
+    outputs = []
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for serial_no, (_, strip) in enumerate(strips, 1):
+            pending.append(executor.submit(save, serial_no, strip))
+            # 限制待编码的切片数量，低内存模式下避免解码速度快于编码时切片堆积
+            if len(pending) >= workers * 2:
+                outputs.append(pending.popleft().result())
+        while pending:
+            outputs.append(pending.popleft().result())
+    return outputs
+
+
+def strip_handler(src_file_path, dst_dir, split_height=1024, min_height=1420):
+    """
+    低内存切割长图，输出文件命名与 pillow_handler 一致
+    :return: 生成的文件路径列表
+    """
+    return split_image(src_file_path, dst_dir, split_height, low_memory=True, min_height=min_height)
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='切割长图片为多张短图')
     parser.add_argument('--input', required=True, help='输入图片路径')
     parser.add_argument('--output', required=True, help='输出图片目录')
-    parser.add_argument('--delta', type=float, default=750, help='每张图片高度，默认为750')
+    parser.add_argument('--delta', type=int, default=750, help='每张图片高度，默认为750')
+    parser.add_argument('--low-memory', action='store_true', help='逐条解码，内存占用只与切片高度有关，适合超长图')
+    parser.add_argument('--backend', choices=['pillow', 'opencv', 'auto'], default='pillow',
+                        help='编码后端，auto 按实测速度和体积为每张图片自动选择')
+    parser.add_argument('--format', choices=list(OUTPUT_EXTENSIONS), default='png', help='输出格式，默认为png')
+    parser.add_argument('--png-compression', type=int, default=6, help='PNG 压缩级别 0-9，默认为6')
+    parser.add_argument('--quality', type=int, default=90, help='WebP/JPEG 质量 1-100，默认为90')
+    parser.add_argument('--workers', type=int, help='编码线程数，默认为CPU核数')
+    parser.add_argument('--index', nargs='?', const=DEFAULT_INDEX_PATH,
+                        help='使用图片内容索引跳过已处理过的相同或近似重复的图片，可指定索引文件路径')
 
     args = parser.parse_args()
 
@@ -77,7 +401,17 @@ if __name__ == '__main__':
 
     delta = args.delta
     # opencv比较快，裁剪出来的图体积较大，python依赖包也大
-    # opencv_handler(src_dir0, dst_dir0, delta)
-
     # pillow与opencv相比处理较慢，裁剪出来的图片文件体积比opencv的小
-    pillow_handler(src_dir0, dst_dir0, delta)
+    # 两者的取舍可以交给 --backend auto 按实测结果决定
+    index = ImageIndex(args.index) if args.index else None
+    namespace = f"img_split:{os.path.abspath(dst_dir0)}:{delta}:{args.format}"
+    try:
+        if index is None or index.should_process(src_dir0, namespace):
+            outputs = split_image(src_dir0, dst_dir0, delta, backend=args.backend, fmt=args.format,
+                                  png_compression=args.png_compression, quality=args.quality,
+                                  max_workers=args.workers, low_memory=args.low_memory)
+            if index is not None and outputs:
+                index.mark_processed(src_dir0, namespace)
+    finally:
+        if index is not None:
+            index.close()
@@ -0,0 +1,311 @@
+import argparse
+import os
+import re
+import shutil
+import struct
+import zlib
+
+"""
+将图片直接组装为PDF，每张图片一页
+
+JPEG 文件以 DCTDecode 流原样写入，不解码、不重新编码，画质零损失；
+PNG 文件在非隔行、无透明通道时直接复用 IDAT 数据（FlateDecode + PNG 预测器），
+其他情况才借助 Pillow 解码后写入
+每页写完即落盘，内存占用只与单张图片有关
+"""
+
+SUPPORTED_FORMATS = {'.jpg', '.jpeg', '.png'}
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# SOF 标记（C4/C8/CC 不是帧头）
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def natural_sort_key(name):
+    """自然排序，保证 img_2 排在 img_10 之前"""
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', name)]
+
+
+def _read_jpeg_bytes(f, size, file_path):
+    """读取 size 个字节，文件被截断时报错"""
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError(f"JPEG文件不完整，未找到帧头: {file_path}")
+    return data
+
+
+def read_jpeg_info(file_path):
+    """
+    只读取 JPEG 帧头，返回 (width, height, components, adobe_inverted)
+    """
+    adobe = False
+    with open(file_path, 'rb') as f:
+        if f.read(2) != b'\xff\xd8':
+            raise ValueError(f"不是合法的JPEG文件: {file_path}")
+        while True:
+            if _read_jpeg_bytes(f, 1, file_path) != b'\xff':
+                continue
+            # 标记前可以有任意多个 0xFF 填充字节，跳过后才是真正的标记
+            marker = _read_jpeg_bytes(f, 1, file_path)[0]
+            while marker == 0xFF:
+                marker = _read_jpeg_bytes(f, 1, file_path)[0]
+            # 独立标记没有长度字段
+            if marker == 0x01 or 0xD0 <= marker <= 0xD9:
+                continue
+            length = struct.unpack('>H', _read_jpeg_bytes(f, 2, file_path))[0]
+            if marker == 0xEE:
+                adobe = _read_jpeg_bytes(f, length - 2, file_path).startswith(b'Adobe')
+                continue
+            if marker in JPEG_SOF_MARKERS:
+                _, height, width, components = struct.unpack('>BHHB', _read_jpeg_bytes(f, 6, file_path))
+                return width, height, components, adobe
+            f.seek(length - 2, os.SEEK_CUR)
+
+
+def read_png_info(file_path):
+    """
+    只扫描 PNG 的块头，返回 IHDR 信息、调色板、tRNS 数据以及所有 IDAT 块的 (偏移, 长度)
+    """
+    info = {'palette': None, 'transparency': False, 'trns': None, 'idat': []}
+    with open(file_path, 'rb') as f:
+        if f.read(8) != PNG_SIGNATURE:
+            raise ValueError(f"不是合法的PNG文件: {file_path}")
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                break
+            length, chunk_type = struct.unpack('>I4s', header)
+            if chunk_type == b'IHDR':
+                (info['width'], info['height'], info['bit_depth'], info['color_type'],
+                 _, _, info['interlace']) = struct.unpack('>IIBBBBB', f.read(13))
+                f.seek(4, os.SEEK_CUR)
+            elif chunk_type == b'PLTE':
+                info['palette'] = f.read(length)
+                f.seek(4, os.SEEK_CUR)
+            elif chunk_type == b'IDAT':
+                info['idat'].append((f.tell(), length))
+                f.seek(length + 4, os.SEEK_CUR)
+            elif chunk_type == b'tRNS':
+                info['transparency'] = True
+                info['trns'] = f.read(length)
+                f.seek(4, os.SEEK_CUR)
+            elif chunk_type == b'IEND':
+                break
+            else:
+                f.seek(length + 4, os.SEEK_CUR)
+    return info
+
+
+class PdfImageWriter:
+    """
+    增量写入的图片PDF：对象写完即落盘，只在内存中保留对象偏移和页对象编号
+
+    用法:
+        with PdfImageWriter(output_path) as writer:
+            writer.add_image(image_path)
+    """
+
+    CATALOG_ID = 1
+    PAGES_ID = 2
+
+    def __init__(self, output_path, dpi=72):
+        self.output_path = output_path
+        self.scale = 72 / dpi
+        self.file = open(output_path, 'wb')
+        self.offsets = {}
+        self.page_ids = []
+        self.next_id = 3
+        # 16 位 PNG 的 IDAT 直接写入（BitsPerComponent 16）需要 PDF 1.5
+        self.file.write(b'%PDF-1.5\n%\xe2\xe3\xcf\xd3\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+
+    def _allocate(self):
+        obj_id = self.next_id
+        self.next_id += 1
+        return obj_id
+
+    def _begin_object(self, obj_id):
+        self.offsets[obj_id] = self.file.tell()
+        self.file.write(f"{obj_id} 0 obj\n".encode())
+
+    def _write_object(self, obj_id, body):
+        self._begin_object(obj_id)
+        self.file.write(body.encode() + b'\nendobj\n')
+
+    def _write_stream(self, obj_id, dictionary, length, write_data):
+        """写入流对象，write_data 负责把恰好 length 字节写入文件"""
+        self._begin_object(obj_id)
+        entries = f"{dictionary} /Length {length}" if dictionary else f"/Length {length}"
+        self.file.write(f"<< {entries} >>\nstream\n".encode())
+        write_data(self.file)
+        self.file.write(b'\nendstream\nendobj\n')
+
+    def _write_bytes_stream(self, obj_id, dictionary, data):
+        self._write_stream(obj_id, dictionary, len(data), lambda f: f.write(data))
+
+    def _add_jpeg(self, image_id, file_path):
+        width, height, components, adobe = read_jpeg_info(file_path)
+        color_space = {1: '/DeviceGray', 3: '/DeviceRGB', 4: '/DeviceCMYK'}[components]
+        dictionary = (f"/Type /XObject /Subtype /Image /Width {width} /Height {height} "
+                      f"/ColorSpace {color_space} /BitsPerComponent 8 /Filter /DCTDecode")
+        if components == 4 and adobe:
+            # Photoshop 等软件写出的 CMYK JPEG 是反相存储的
+            dictionary += " /Decode [1 0 1 0 1 0 1 0]"
+
+        def copy_file(f):
+            with open(file_path, 'rb') as src:
+                shutil.copyfileobj(src, f, 1024 * 1024)
+
+        self._write_stream(image_id, dictionary, os.path.getsize(file_path), copy_file)
+        return width, height
+
+    def _add_png(self, image_id, file_path):
+        info = read_png_info(file_path)
+        color_type = info['color_type']
+        if info['interlace'] or info['transparency'] or color_type not in (0, 2, 3):
+            return self._add_decoded(image_id, file_path)
+
+        width, height = info['width'], info['height']
+        if color_type == 3:
+            palette = info['palette']
+            color_space = f"[/Indexed /DeviceRGB {len(palette) // 3 - 1} <{palette.hex()}>]"
+            colors = 1
+        else:
+            color_space = '/DeviceGray' if color_type == 0 else '/DeviceRGB'
+            colors = 1 if color_type == 0 else 3
+        dictionary = (f"/Type /XObject /Subtype /Image /Width {width} /Height {height} "
+                      f"/ColorSpace {color_space} /BitsPerComponent {info['bit_depth']} /Filter /FlateDecode "
+                      f"/DecodeParms << /Predictor 15 /Colors {colors} "
+                      f"/BitsPerComponent {info['bit_depth']} /Columns {width} >>")
+
+        def copy_idat(f):
+            # IDAT 拼接后就是一条完整的 zlib 流，逐块拷贝，不解压
+            with open(file_path, 'rb') as src:
+                for offset, length in info['idat']:
+                    src.seek(offset)
+                    remaining = length
+                    while remaining:
+                        chunk = src.read(min(remaining, 1024 * 1024))
+                        f.write(chunk)
+                        remaining -= len(chunk)
+
+        length = sum(length for _, length in info['idat'])
+        self._write_stream(image_id, dictionary, length, copy_idat)
+        return width, height
+
+    def _add_decoded(self, image_id, file_path):
+        """无法直接复用数据的PNG（透明、隔行等），解码后以 FlateDecode 写入，透明通道写为 SMask"""
+        from PIL import Image
+
+        with Image.open(file_path) as img:
+            has_alpha = img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info
+            if img.mode in ('1', 'L', 'LA', 'I;16'):
+                color_mode, color_space = 'L', '/DeviceGray'
+            else:
+                color_mode, color_space = 'RGB', '/DeviceRGB'
+            if has_alpha:
+                img = img.convert('RGBA' if color_mode == 'RGB' else 'LA')
+                alpha = img.getchannel('A')
+            width, height = img.size
+            color = img.convert(color_mode)
+
+            dictionary = (f"/Type /XObject /Subtype /Image /Width {width} /Height {height} "
+                          f"/ColorSpace {color_space} /BitsPerComponent 8 /Filter /FlateDecode")
+            if has_alpha:
+                mask_id = self._allocate()
+                self._write_bytes_stream(
+                    mask_id,
+                    f"/Type /XObject /Subtype /Image /Width {width} /Height {height} "
+                    f"/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode",
+                    zlib.compress(alpha.tobytes(), 6))
+                dictionary += f" /SMask {mask_id} 0 R"
+            self._write_bytes_stream(image_id, dictionary, zlib.compress(color.tobytes(), 6))
+        return width, height
+
+    def add_image(self, file_path):
+        """追加一页，页面尺寸与图片像素尺寸按 dpi 换算"""
+        ext = os.path.splitext(file_path)[1].lower()
+        image_id = self._allocate()
+        if ext in ('.jpg', '.jpeg'):
+            width, height = self._add_jpeg(image_id, file_path)
+        elif ext == '.png':
+            width, height = self._add_png(image_id, file_path)
+        else:
+            width, height = self._add_decoded(image_id, file_path)
+
+        page_width = round(width * self.scale, 3)
+        page_height = round(height * self.scale, 3)
+        content_id = self._allocate()
+        self._write_bytes_stream(content_id, '', f"q {page_width} 0 0 {page_height} 0 0 cm /Im0 Do Q".encode())
+
+        page_id = self._allocate()
+        self._write_object(
+            page_id,
+            f"<< /Type /Page /Parent {self.PAGES_ID} 0 R /MediaBox [0 0 {page_width} {page_height}] "
+            f"/Resources << /XObject << /Im0 {image_id} 0 R >> >> /Contents {content_id} 0 R >>")
+        self.page_ids.append(page_id)
+
+    def close(self):
+        """写入页树、目录、交叉引用表和文件尾"""
+        kids = ' '.join(f"{page_id} 0 R" for page_id in self.page_ids)
+        self._write_object(self.PAGES_ID, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>")
+        self._write_object(self.CATALOG_ID, f"<< /Type /Catalog /Pages {self.PAGES_ID} 0 R >>")
+
+        xref_offset = self.file.tell()
+        lines = [f"xref\n0 {self.next_id}\n", "0000000000 65535 f \n"]
+        lines.extend(f"{self.offsets[obj_id]:010d} 00000 n \n" for obj_id in range(1, self.next_id))
+        lines.append(f"trailer\n<< /Size {self.next_id} /Root {self.CATALOG_ID} 0 R >>\n"
+                     f"startxref\n{xref_offset}\n%%EOF\n")
+        self.file.write(''.join(lines).encode())
+        self.file.close()
+
+
+def images_to_pdf(image_paths, output_path, dpi=72):
+    """
+    将图片按顺序组装为PDF，每张图片一页
+
+    参数:
+        image_paths: 图片路径列表
+        output_path: 输出PDF路径
+        dpi: 图片分辨率，决定页面的物理尺寸，默认72（1像素=1点）
+
+    返回:
+        写入的页数
+    """
+    total = len(image_paths)
+    with PdfImageWriter(output_path, dpi) as writer:
+        for i, image_path in enumerate(image_paths, 1):
+            writer.add_image(image_path)
+            if i % 100 == 0 or i == total:
+                print(f"[{i}/{total}] 已写入: {image_path}")
+    print(f"已保存: {output_path}")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description='将目录中的图片无损组装为PDF')
+    parser.add_argument('--input', required=True, help='输入图片目录')
+    parser.add_argument('--output', required=True, help='输出PDF路径')
+    parser.add_argument('--dpi', type=float, default=72, help='图片分辨率，默认为72')
+
+    args = parser.parse_args()
+    if not os.path.isdir(args.input):
+        print(f"错误: 输入目录 '{args.input}' 不存在")
+        return
+
+    names = sorted((name for name in os.listdir(args.input)
+                    if os.path.splitext(name)[1].lower() in SUPPORTED_FORMATS), key=natural_sort_key)
+    images_to_pdf([os.path.join(args.input, name) for name in names], args.output, args.dpi)
+
+
+if __name__ == "__main__":
+    main()
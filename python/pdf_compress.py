@@ -1,6 +1,12 @@
 import subprocess
 import os
 import argparse
+import hashlib
+import json
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 """
 如果你已经安装了 Homebrew（macOS 包管理器），直接运行：
@@ -12,21 +18,24 @@ gs --version
 """
 
 
-def compress_pdf_ghostscript(input_path, output_path, quality=3):
+QUALITY_SETTINGS = ['screen', 'ebook', 'prepress']
+
+MANIFEST_NAME = '.compress_manifest.json'
+
+
+def build_gs_params(input_path, output_path, quality=3, extra_params=None):
     """
-    使用 Ghostscript 压缩 PDF
-    :param input_path: 输入 PDF 路径
-    :param output_path: 输出 PDF 路径
-    :param quality: 压缩质量（1=低质量高压缩，2=中等，3=高质量低压缩）
+    构建 Ghostscript 命令行参数
+    :param extra_params: 追加的 gs 参数列表，例如 ["-dColorImageResolution=150"]
     """
-    # Ghostscript 参数
-    gs_params = [
+    return [
         "gs",  # macOS/Linux 直接调用 gs，Windows 用 gswin64c
         "-sDEVICE=pdfwrite",
         "-dCompatibilityLevel=1.4",
         # "-sColorConversionStrategy=Gray",
         # "-dProcessColorModel=/DeviceGray",
-        f"-dPDFSETTINGS=/{['screen', 'ebook', 'prepress'][quality - 1]}",
+        f"-dPDFSETTINGS=/{QUALITY_SETTINGS[quality - 1]}",
+        *(extra_params or []),
         "-dNOPAUSE",
         "-dQUIET",
         "-dBATCH",
@@ -34,13 +43,232 @@ def compress_pdf_ghostscript(input_path, output_path, quality=3):
         input_path,
     ]
 
+
+def run_ghostscript(input_path, output_path, quality=3, extra_params=None):
+    """
+    执行一次 Ghostscript 压缩
+    :return: (是否成功, 错误信息)
+    """
     try:
-        subprocess.run(gs_params, check=True)
-        print(f"✅ PDF 压缩成功！压缩质量: {quality}, 保存至: {output_path}")
+        subprocess.run(build_gs_params(input_path, output_path, quality, extra_params),
+                       check=True, capture_output=True, text=True)
+        return True, ''
     except subprocess.CalledProcessError as e:
-        print(f"❌ 压缩失败: {e}")
+        return False, (e.stderr or str(e)).strip()
     except FileNotFoundError:
-        print("❌ 未找到 Ghostscript，请确保已安装！")
+        return False, "未找到 Ghostscript，请确保已安装！"
+
+
+def compress_pdf_ghostscript(input_path, output_path, quality=3):
+    """
+    使用 Ghostscript 压缩 PDF
+    :param input_path: 输入 PDF 路径
+    :param output_path: 输出 PDF 路径
+    :param quality: 压缩质量（1=低质量高压缩，2=中等，3=高质量低压缩）
+    """
+    success, message = run_ghostscript(input_path, output_path, quality)
+    if success:
+        print(f"✅ PDF 压缩成功！压缩质量: {quality}, 保存至: {output_path}")
+    else:
+        print(f"❌ 压缩失败: {message}")
+    return success
+
+
+def compress_pdf_adaptive(input_path, output_path, target_mb=10, resolutions=None, max_workers=None):
+    """
+    自适应压缩：并行尝试多组参数，选出体积不超过目标大小的最高质量结果
+    都超出目标时退而选择体积最小的结果，中间文件统一放在临时目录中并在结束时清理
+
+    :param target_mb: 目标大小（MB）
+    :param resolutions: 额外尝试的图片分辨率列表（dpi），在 prepress 基础上设置 -dColorImageResolution
+    :param max_workers: 并发数，默认为候选参数个数
+    :return: 选中的候选参数说明，全部失败时返回 None
+    """
+    # 三种预设的默认图片分辨率分别约为 72/150/300 dpi，候选参数按分辨率从低到高排列（即质量从低到高）
+    candidates = [(72, "quality=1", 1, None), (150, "quality=2", 2, None), (300, "quality=3", 3, None)]
+    for dpi in resolutions or []:
+        candidates.append((dpi, f"quality=3,dpi={dpi}", 3, [
+            "-dDownsampleColorImages=true",
+            f"-dColorImageResolution={dpi}",
+            "-dDownsampleGrayImages=true",
+            f"-dGrayImageResolution={dpi}",
+        ]))
+    candidates = [c[1:] for c in sorted(candidates, key=lambda c: c[0])]
+
+    target_bytes = target_mb * 1024 * 1024
+    temp_dir = tempfile.mkdtemp(prefix='pdf_adaptive_')
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers or len(candidates)) as executor:
+            futures = []
+            for i, (label, quality, extra_params) in enumerate(candidates):
+                temp_path = os.path.join(temp_dir, f"candidate_{i}.pdf")
+                futures.append(executor.submit(run_ghostscript, input_path, temp_path, quality, extra_params))
+
+            results = []
+            for i, ((label, _, _), future) in enumerate(zip(candidates, futures)):
+                success, message = future.result()
+                temp_path = os.path.join(temp_dir, f"candidate_{i}.pdf")
+                if not success:
+                    print(f"❌ {label} 压缩失败: {message}")
+                    continue
+                size = os.path.getsize(temp_path)
+                print(f"{label}: {size / 1024 / 1024:.2f} MB")
+                results.append((label, temp_path, size))
+
+        if not results:
+            print("❌ 所有参数均压缩失败")
+            return None
+
+        fitting = [r for r in results if r[2] <= target_bytes]
+        if fitting:
+            # 结果按质量从低到高排列，取最后一个即为满足大小的最高质量
+            label, temp_path, size = fitting[-1]
+        else:
+            label, temp_path, size = min(results, key=lambda r: r[2])
+            print(f"⚠️ 没有结果小于 {target_mb} MB，选择体积最小的结果")
+        shutil.move(temp_path, output_path)
+        print(f"✅ 选择 {label}, {size / 1024 / 1024:.2f} MB, 保存至: {output_path}")
+        return label
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    """分块计算文件的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(manifest_path):
+    """读取压缩清单，不存在或损坏时返回空清单"""
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_manifest(manifest_path, manifest):
+    """先写临时文件再替换，避免中断时留下损坏的清单"""
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def _compress_job(input_path, output_path, quality, manifest):
+    """批量压缩中的单个任务，在线程中执行，线程只负责等待 gs 子进程"""
+    started = time.perf_counter()
+    # 按源文件路径和内容哈希记录，内容相同的不同文件各自有输出
+    key = f"{os.path.abspath(input_path)}:{file_sha256(input_path)}:quality={quality}"
+    input_size = os.path.getsize(input_path)
+    record = {
+        'input': input_path,
+        'output': output_path,
+        'input_size': input_size,
+    }
+
+    cached = manifest.get(key)
+    if cached and os.path.exists(cached['output']):
+        record.update(cached, status='skipped', seconds=time.perf_counter() - started)
+        return key, record
+
+    success, message = run_ghostscript(input_path, output_path, quality)
+    record['seconds'] = time.perf_counter() - started
+    if not success:
+        record.update(status='failed', error=message)
+        return key, record
+
+    output_size = os.path.getsize(output_path)
+    record.update(status='compressed', output_size=output_size,
+                  ratio=output_size / input_size if input_size else 0)
+    return key, record
+
+
+def _batch_output_dir(input_dir, output_dir):
+    """批量模式的输出目录，默认为 输入目录_compressed，与输入目录相同时报错（输出会覆盖正在读取的源文件）"""
+    output_dir = output_dir or input_dir.rstrip(os.sep) + '_compressed'
+    if os.path.realpath(output_dir) == os.path.realpath(input_dir):
+        raise ValueError(f"输出目录不能与输入目录相同: {output_dir}")
+    os.makedirs(output_dir, exist_ok=True)
+    return output_dir
+
+
+def compress_pdf_adaptive_batch(input_dir, output_dir=None, target_mb=10, resolutions=None, max_workers=None):
+    """
+    对目录下的 PDF 逐个执行自适应压缩，每个文件的候选参数并行尝试，见 compress_pdf_adaptive
+
+    :param output_dir: 输出目录，默认为 输入目录_compressed，不能与输入目录相同
+    :return: {文件名: 选中的候选参数说明，失败时为 None}
+    """
+    output_dir = _batch_output_dir(input_dir, output_dir)
+    pdf_files = sorted(name for name in os.listdir(input_dir) if name.lower().endswith('.pdf'))
+    print(f"共 {len(pdf_files)} 个PDF, 目标大小: {target_mb} MB")
+    selected = {}
+    for i, name in enumerate(pdf_files, 1):
+        print(f"[{i}/{len(pdf_files)}] {name}")
+        selected[name] = compress_pdf_adaptive(os.path.join(input_dir, name), os.path.join(output_dir, name),
+                                               target_mb, resolutions, max_workers)
+    failed = [name for name, label in selected.items() if label is None]
+    print(f"完成: {len(pdf_files) - len(failed)} 个成功, {len(failed)} 个失败")
+    return selected
+
+
+def compress_pdf_batch(input_dir, output_dir=None, quality=2, max_workers=None):
+    """
+    批量压缩目录下的 PDF，同时保持最多 max_workers 个 gs 子进程运行
+    已按相同参数压缩过且内容未变的文件（按输入文件路径和哈希判断）会被跳过
+
+    :param input_dir: 输入目录
+    :param output_dir: 输出目录，默认为 输入目录_compressed，不能与输入目录相同（输出会覆盖正在读取的源文件）
+    :param quality: 压缩质量，同 compress_pdf_ghostscript
+    :param max_workers: 并发数，默认为 CPU 核数
+    :return: 每个文件的结果列表
+    """
+    output_dir = _batch_output_dir(input_dir, output_dir)
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+
+    pdf_files = sorted(name for name in os.listdir(input_dir) if name.lower().endswith('.pdf'))
+    workers = max_workers or os.cpu_count() or 1
+    print(f"共 {len(pdf_files)} 个PDF, 并发数: {workers}")
+
+    started = time.perf_counter()
+    results = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_compress_job, os.path.join(input_dir, name),
+                            os.path.join(output_dir, name), quality, manifest)
+            for name in pdf_files
+        ]
+        for future in as_completed(futures):
+            key, record = future.result()
+            results.append(record)
+            if record['status'] == 'compressed':
+                manifest[key] = {k: record[k] for k in ('output', 'output_size', 'ratio')}
+                save_manifest(manifest_path, manifest)
+            print(f"[{len(results)}/{len(pdf_files)}] {record['status']}: {record['input']}")
+
+    results.sort(key=lambda r: r['input'])
+    print_report(results, time.perf_counter() - started)
+    return results
+
+
+def print_report(results, total_seconds):
+    """打印批量压缩报告：输入大小、输出大小、压缩率、耗时"""
+    print(f"{'文件':<40} {'状态':<10} {'输入(MB)':>10} {'输出(MB)':>10} {'压缩率':>8} {'耗时(s)':>8}")
+    for r in results:
+        output_size = r.get('output_size')
+        print(f"{os.path.basename(r['input']):<40} {r['status']:<10} "
+              f"{r['input_size'] / 1024 / 1024:>10.2f} "
+              f"{(output_size / 1024 / 1024 if output_size is not None else 0):>10.2f} "
+              f"{r.get('ratio', 0):>8.1%} {r['seconds']:>8.2f}")
+        if r['status'] == 'failed':
+            print(f"  ❌ {r['error']}")
+    print(f"总耗时: {total_seconds:.2f}s")
 
 
 def add_suffix_to_filename(absolute_path, suffix):
@@ -71,17 +299,33 @@ def add_suffix_to_filename(absolute_path, suffix):
 
 # 使用示例
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description='切割长图片为多张短图')
-    parser.add_argument('--input', required=True, help='输入图片路径')
-    parser.add_argument('--output', help='输出图片目录')
+    parser = argparse.ArgumentParser(description='使用 Ghostscript 压缩 PDF')
+    parser.add_argument('--input', required=True, help='输入PDF路径，传入目录时批量压缩')
+    parser.add_argument('--output', help='输出PDF路径，批量模式下为输出目录')
     parser.add_argument('--quality', type=int, default=2, help='压缩质量，1=低质量，2=中等，3=高质量')
+    parser.add_argument('--workers', type=int, help='批量模式下的并发数，默认为CPU核数')
+    parser.add_argument('--target-mb', type=float,
+                        help='自适应模式：目标大小(MB)，选择不超过该大小的最高质量，传入目录时逐个文件自适应压缩')
+    parser.add_argument('--resolutions', type=int, nargs='*', help='自适应模式下额外尝试的图片分辨率(dpi)')
 
     args = parser.parse_args()
 
     quality = args.quality
     path_in = args.input
-    if not args.output:
-        path_out = add_suffix_to_filename(path_in, '_compressed')
+    if os.path.isdir(path_in):
+        try:
+            if args.target_mb:
+                compress_pdf_adaptive_batch(path_in, args.output, args.target_mb, args.resolutions, args.workers)
+            else:
+                compress_pdf_batch(path_in, args.output, quality, args.workers)
+        except ValueError as e:
+            parser.error(str(e))
     else:
-        path_out = args.output
-    compress_pdf_ghostscript(path_in, path_out, quality)
+        if not args.output:
+            path_out = add_suffix_to_filename(path_in, '_compressed')
+        else:
+            path_out = args.output
+        if args.target_mb:
+            compress_pdf_adaptive(path_in, path_out, args.target_mb, args.resolutions, args.workers)
+        else:
+            compress_pdf_ghostscript(path_in, path_out, quality)
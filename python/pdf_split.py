@@ -1,29 +1,163 @@
 import os
+from concurrent.futures import ProcessPoolExecutor
 
 from PyPDF2 import PdfWriter, PdfReader
+from PyPDF2.generic import IndirectObject
 
 
-def split_pdf(input_pdf_path, output_folder, pages_per_pdf=1):
+# 进程池中每个进程各自打开一次的PdfReader，见 _init_reader
+_reader = None
+
+
+def _init_reader(input_pdf_path):
+    """进程池的initializer：每个进程只解析一次源PDF，之后的分片任务都复用它"""
+    global _reader
+    _reader = PdfReader(input_pdf_path)
+
+
+def _write_chunk(task):
+    """写出一个分片（进程池任务），使用本进程的 _reader"""
+    start, end, output_path = task
+    writer = PdfWriter()
+    for j in range(start, end):
+        writer.add_page(_reader.pages[j])
+    with open(output_path, "wb") as f:
+        writer.write(f)
+    return output_path
+
+
+def write_chunks(input_pdf_path, output_folder, page_ranges, max_workers=None):
+    """
+    按页码区间并行写出分片，每个进程打开一次源PDF，分片按批分发给进程，减少进程间通信次数
+
+    :param page_ranges: [(start, end), ...]，左闭右开，0-based
+    :param max_workers: 进程数，默认为CPU核数
+    :return: 生成的文件路径列表，顺序与page_ranges一致
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    tasks = [
+        (start, end, os.path.join(output_folder, f"part_{i + 1}.pdf"))
+        for i, (start, end) in enumerate(page_ranges)
+    ]
+    workers = max_workers or os.cpu_count() or 1
+    if len(tasks) <= 1 or workers == 1:
+        _init_reader(input_pdf_path)
+        return [_write_chunk(task) for task in tasks]
+
+    # 每个进程大约分到4批，兼顾负载均衡和通信开销
+    chunksize = max(1, len(tasks) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_reader,
+                             initargs=(input_pdf_path,)) as executor:
+        return list(executor.map(_write_chunk, tasks, chunksize=chunksize))
+
+
+def split_pdf(input_pdf_path, output_folder, pages_per_pdf=1, max_workers=None):
     """直接按页数拆分PDF"""
     reader = PdfReader(input_pdf_path)
     total_pages = len(reader.pages)
 
-    os.makedirs(output_folder, exist_ok=True)
-    generated_files = []
+    page_ranges = [(i, min(i + pages_per_pdf, total_pages)) for i in range(0, total_pages, pages_per_pdf)]
+    return write_chunks(input_pdf_path, output_folder, page_ranges, max_workers)
+
+
+def _stream_length(obj):
+    """读取流对象的原始（压缩后）字节数"""
+    length = obj.get("/Length")
+    if isinstance(length, IndirectObject):
+        length = length.get_object()
+    if length is None:
+        length = len(getattr(obj, "_data", b"") or b"")
+    return int(length)
 
-    for i in range(0, total_pages, pages_per_pdf):
-        writer = PdfWriter()
-        end = min(i + pages_per_pdf, total_pages)
 
-        for j in range(i, end):
-            writer.add_page(reader.pages[j])
+def _collect_resources(resources, found):
+    """收集资源字典中XObject（图片、表单）的字节数，按对象号记入found，表单会递归收集其自身资源"""
+    if resources is None:
+        return
+    resources = resources.get_object()
+    xobjects = resources.get("/XObject")
+    if xobjects is None:
+        return
 
-        output_path = os.path.join(output_folder, f"part_{i // pages_per_pdf + 1}.pdf")
-        with open(output_path, "wb") as f:
-            writer.write(f)
-        generated_files.append(output_path)
+    for ref in xobjects.get_object().values():
+        key = ref.idnum if isinstance(ref, IndirectObject) else id(ref)
+        if key in found:
+            continue
+        xobject = ref.get_object()
+        found[key] = _stream_length(xobject)
+        if xobject.get("/Subtype") == "/Form":
+            _collect_resources(xobject.get("/Resources"), found)
+
+
+def estimate_page_sizes(reader):
+    """
+    根据页面资源估算每页写出后的字节数（内容流 + 图片等XObject的原始流长度）
+    多个页面共享的资源在分片中只写一次，因此资源按对象号单独返回，由plan_chunks_by_size按分片去重
+
+    :return: [(内容流字节数, {资源对象号: 字节数}), ...]
+    """
+    pages = []
+    for page in reader.pages:
+        size = 0
+        contents = page.get("/Contents")
+        if contents is not None:
+            contents = contents.get_object()
+            # /Contents 可能是单个流，也可能是流数组
+            streams = contents if isinstance(contents, list) else [contents]
+            size += sum(_stream_length(stream.get_object()) for stream in streams)
+        resources = {}
+        _collect_resources(page.get("/Resources"), resources)
+        pages.append((size, resources))
+    return pages
+
+
+def chunk_size(pages):
+    """估算一组页面写入同一分片后的字节数，共享的资源只计一次"""
+    seen = {}
+    for _, resources in pages:
+        seen.update(resources)
+    return sum(size for size, _ in pages) + sum(seen.values())
+
+
+def plan_chunks_by_size(pages, max_bytes):
+    """
+    贪心地把连续页面装入分片，使每个分片的估算大小不超过max_bytes
+    每个分片记录已计入的资源，与前面页面共享的资源不再重复计算；单页超过上限时独占一个分片
+
+    :param pages: estimate_page_sizes的返回值
+    :return: [(start, end), ...]，左闭右开
+    """
+    page_ranges = []
+    start = 0
+    current = 0
+    seen = set()
+    for i, (size, resources) in enumerate(pages):
+        added = size + sum(length for key, length in resources.items() if key not in seen)
+        if i > start and current + added > max_bytes:
+            page_ranges.append((start, i))
+            start = i
+            current = 0
+            # 新分片中该页的资源都要重新写入
+            seen = set()
+            added = size + sum(resources.values())
+        current += added
+        seen.update(resources)
+    if start < len(pages):
+        page_ranges.append((start, len(pages)))
+    return page_ranges
+
+
+def split_pdf_by_size(input_pdf_path, output_folder, max_size_mb=50, max_workers=None):
+    """按目标大小拆分PDF，适用于页面大小差异很大的扫描件"""
+    reader = PdfReader(input_pdf_path)
+    pages = estimate_page_sizes(reader)
+    page_ranges = plan_chunks_by_size(pages, max_size_mb * 1024 * 1024)
+
+    for i, (start, end) in enumerate(page_ranges, 1):
+        estimated = chunk_size(pages[start:end]) / 1024 / 1024
+        print(f"part_{i}: 第{start + 1}-{end}页, 估算 {estimated:.1f} MB")
+    return write_chunks(input_pdf_path, output_folder, page_ranges, max_workers)
 
-    return generated_files
 
 # 使用示例
 if __name__ == "__main__":
@@ -35,3 +169,6 @@ if __name__ == "__main__":
 
     # 每个小PDF包含100张图片
     split_pdf(input_pdf, output_dir, pages_per_pdf=100)
+
+    # 或者按目标大小拆分，每个小PDF不超过50MB
+    # split_pdf_by_size(input_pdf, output_dir, max_size_mb=50)
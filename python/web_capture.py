@@ -1,24 +1,306 @@
+import argparse
+import base64
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlparse
+
 from selenium import webdriver
+from selenium.common.exceptions import TimeoutException, WebDriverException
 from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.common.by import By
+from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from webdriver_manager.chrome import ChromeDriverManager
-import time
 
 
-def save_slide_node_as_image(slides_url, node_selector, output_path):
-    # 初始化Chrome浏览器（无头模式，不显示窗口）
+@lru_cache(maxsize=None)
+def chromedriver_path():
+    """
+    chromedriver 路径，整个进程只解析一次
+    优先使用环境变量 CHROMEDRIVER；webdriver-manager 需要联网，离线时返回 None，
+    交给 selenium 从 PATH 中查找
+    """
+    path = os.getenv('CHROMEDRIVER')
+    if path:
+        return path
+    try:
+        return ChromeDriverManager().install()
+    except Exception as e:
+        print(f"webdriver-manager 不可用，使用 PATH 中的 chromedriver: {e}")
+        return None
+
+
+def create_driver(window_size=(1920, 1080), headless=True):
+    """启动一个 Chrome 实例"""
     options = webdriver.ChromeOptions()
-    options.add_argument("--headless")  # 无头模式，可选
+    if headless:
+        options.add_argument("--headless")
     options.add_argument("--disable-gpu")
-    options.add_argument("--window-size=1920,1080")  # 设置窗口大小，避免节点被截断
+    options.add_argument(f"--window-size={window_size[0]},{window_size[1]}")  # 设置窗口大小，避免节点被截断
+    # 多个标签页同时加载时，后台标签页不降低定时器和渲染频率
+    options.add_argument("--disable-background-timer-throttling")
+    options.add_argument("--disable-backgrounding-occluded-windows")
+    options.add_argument("--disable-renderer-backgrounding")
+    # 允许 file:// 页面加载本地资源
+    options.add_argument("--allow-file-access-from-files")
+    driver_path = chromedriver_path()
+    service = Service(driver_path) if driver_path else Service()
+    return webdriver.Chrome(service=service, options=options)
+
+
+# 在页面中等待渲染稳定：文档加载完成、图片和字体加载完毕、DOM 在 quiet 毫秒内没有变化，
+# 最后再等两帧 requestAnimationFrame 确保最后一次布局已经绘制；超过 timeout 毫秒直接返回
+READY_SCRIPT = """
+const [quietMs, timeoutMs, done] = arguments;
+const start = performance.now();
+let last = start;
+const observer = new MutationObserver(() => { last = performance.now(); });
+observer.observe(document, {subtree: true, childList: true, attributes: true, characterData: true});
+const pending = () => {
+    if (document.readyState !== 'complete') return 'document';
+    for (const img of document.images) { if (!img.complete) return 'images'; }
+    if (document.fonts && document.fonts.status !== 'loaded') return 'fonts';
+    return null;
+};
+const finish = (state) => {
+    observer.disconnect();
+    done({state: state, waited: (performance.now() - start) / 1000});
+};
+// 后台标签页可能不触发 requestAnimationFrame，用定时器兜底
+const nextFrame = (callback) => {
+    let called = false;
+    const once = () => { if (!called) { called = true; callback(); } };
+    requestAnimationFrame(once);
+    setTimeout(once, 100);
+};
+const tick = () => {
+    const now = performance.now();
+    const waiting = pending();
+    if (now - start >= timeoutMs) return finish('timeout:' + (waiting || 'mutations'));
+    if (!waiting && now - last >= quietMs) return nextFrame(() => nextFrame(() => finish('ready')));
+    setTimeout(tick, 50);
+};
+tick();
+"""
+
+
+def wait_until_ready(driver, quiet=0.5, timeout=10.0):
+    """
+    等待页面渲染稳定，代替固定的 sleep
+    :param quiet: DOM 连续无变化多少秒视为稳定
+    :param timeout: 最长等待秒数，超时后不报错，直接截图
+    :return: (状态, 实际等待秒数)，状态为 ready 或 timeout:<仍在等待的内容>
+    """
+    driver.set_script_timeout(timeout + 5)
+    result = driver.execute_async_script(READY_SCRIPT, int(quiet * 1000), int(timeout * 1000))
+    return result['state'], result['waited']
+
+
+def to_url(target):
+    """本地 HTML 文件路径转为 file:// 地址，其他地址原样返回"""
+    if urlparse(target).scheme in ('http', 'https', 'file', 'data', 'about'):
+        return target
+    return Path(target).resolve().as_uri()
+
+
+def error_message(e):
+    """异常的第一行信息，selenium 的超时等异常 str() 只有 "Message:"，没有内容时用异常类型名代替"""
+    lines = (e.msg or '' if isinstance(e, WebDriverException) else str(e)).strip().splitlines()
+    return lines[0] if lines else type(e).__name__
+
+
+class CaptureService:
+    """
+    保持一组预热的浏览器，批量截取页面节点
+
+    每个浏览器同时打开多个标签页并行加载页面，依次截图；浏览器处理 recycle_after 个任务后
+    重启，限制长时间运行时的内存增长。浏览器在多次 capture 调用之间复用。
+
+    用法:
+        with CaptureService(drivers=2, tabs=4) as service:
+            results = service.capture([(url, selector, output_path), ...])
+    """
+
+    def __init__(self, drivers=2, tabs=4, recycle_after=50, quiet=0.5, settle_timeout=10.0, timeout=20,
+                 window_size=(1920, 1080), headless=True):
+        """
+        :param drivers: 浏览器数量
+        :param tabs: 每个浏览器同时加载的标签页数
+        :param recycle_after: 浏览器处理多少个任务后重启，0 表示不重启
+        :param quiet: 节点出现后，DOM 连续无变化多少秒视为渲染完成，见 wait_until_ready
+        :param settle_timeout: 节点出现后等待渲染稳定的最长秒数
+        :param timeout: 等待节点出现的超时秒数
+        """
+        self.tabs = max(1, tabs)
+        self.recycle_after = recycle_after
+        self.quiet = quiet
+        self.settle_timeout = settle_timeout
+        self.timeout = timeout
+        self.window_size = window_size
+        self.headless = headless
+        # 每个槽位为 [driver, 已处理任务数]
+        # 所有浏览器并行启动
+        drivers = max(1, drivers)
+        with ThreadPoolExecutor(max_workers=drivers) as executor:
+            self._slots = [[driver, 0] for driver in
+                           executor.map(lambda _: create_driver(window_size, headless), range(drivers))]
+        self._print_lock = threading.Lock()
+
+    def close(self):
+        for slot in self._slots:
+            self._quit(slot[0])
+        self._slots = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @staticmethod
+    def _quit(driver):
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def _recycle(self, slot):
+        self._quit(slot[0])
+        slot[0] = create_driver(self.window_size, self.headless)
+        slot[1] = 0
+
+    def _open_tabs(self, driver, jobs):
+        """为每个任务打开一个标签页，不等待加载完成，所有页面并行加载"""
+        base = driver.current_window_handle
+        opened = []
+        for job in jobs:
+            driver.switch_to.new_window('tab')
+            driver.execute_script("window.location.href = arguments[0];", to_url(job[0]))
+            opened.append((driver.current_window_handle, job))
+        driver.switch_to.window(base)
+        return base, opened
+
+    def _capture_tab(self, driver, handle, job):
+        url, selector, output_path = job
+        started = time.perf_counter()
+        result = {'url': url, 'selector': selector, 'output': output_path, 'ready': None, 'waited': 0.0}
+        try:
+            driver.switch_to.window(handle)
+            target_node = WebDriverWait(driver, self.timeout).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, selector))
+            )
+            # 等待图片、字体加载完成且 DOM 不再变化，渲染快的页面无需多等
+            state, waited = wait_until_ready(driver, self.quiet, self.settle_timeout)
+            result.update(ready=state, waited=waited)
+            os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+            target_node.screenshot(output_path)
+            result.update(status='saved', message='')
+        except Exception as e:
+            result.update(status='failed', message=error_message(e))
+        finally:
+            try:
+                driver.close()
+            except Exception:
+                pass
+        result['seconds'] = time.perf_counter() - started
+        return result
+
+    @staticmethod
+    def _failed_result(job, message):
+        url, selector, output_path = job
+        return {'url': url, 'selector': selector, 'output': output_path, 'status': 'failed',
+                'seconds': 0.0, 'ready': None, 'waited': 0.0, 'message': message}
+
+    def _print_result(self, result, total, results):
+        with self._print_lock:
+            done = sum(r is not None for r in results)
+            if result['status'] == 'saved':
+                print(f"[{done}/{total}] 节点已保存至：{result['output']} "
+                      f"({result['seconds']:.1f}s, 等待渲染 {result['waited']:.2f}s {result['ready']})")
+            else:
+                print(f"[{done}/{total}] 操作失败：{result['url']} {result['message']}")
+
+    def _worker(self, slot, jobs, results, total):
+        while True:
+            batch = []
+            limit = self.tabs
+            if self.recycle_after:
+                limit = min(limit, self.recycle_after - slot[1])
+            while len(batch) < limit:
+                try:
+                    batch.append(jobs.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+
+            try:
+                try:
+                    base, opened = self._open_tabs(slot[0], [job for _, job in batch])
+                except Exception as e:
+                    # 浏览器已失效，重启后重试一次
+                    print(f"浏览器异常，正在重启: {error_message(e)}")
+                    self._recycle(slot)
+                    base, opened = self._open_tabs(slot[0], [job for _, job in batch])
+
+                for (position, _), (handle, job) in zip(batch, opened):
+                    results[position] = self._capture_tab(slot[0], handle, job)
+                    self._print_result(results[position], total, results)
+                slot[0].switch_to.window(base)
+            except Exception as e:
+                # 整批失败（重启后仍无法打开标签页、浏览器崩溃等）：本批还没有结果的任务记为失败，
+                # 重启浏览器后继续处理后面的任务
+                message = error_message(e)
+                for position, job in batch:
+                    if results[position] is None:
+                        results[position] = self._failed_result(job, message)
+                        self._print_result(results[position], total, results)
+                self._recycle(slot)
+                continue
 
-    # 启动浏览器
-    driver = webdriver.Chrome(
-        service=Service(ChromeDriverManager().install()),
-        options=options
-    )
+            slot[1] += len(batch)
+            if self.recycle_after and slot[1] >= self.recycle_after:
+                self._recycle(slot)
+
+    def capture(self, jobs):
+        """
+        批量截取节点
+        :param jobs: [(页面地址或本地 HTML 路径, 节点 CSS 选择器, 输出图片路径), ...]
+        :return: 与 jobs 顺序一致的结果列表
+                 [{'url', 'selector', 'output', 'status', 'seconds', 'ready', 'waited', 'message'}, ...]
+                 status 为 saved/failed，ready/waited 为渲染等待的状态和秒数，见 wait_until_ready
+        """
+        pending = queue.Queue()
+        for position, job in enumerate(jobs):
+            pending.put((position, tuple(job)))
+        results = [None] * len(jobs)
+        # 每个浏览器由一个线程独占驱动（WebDriver 不是线程安全的）
+        with ThreadPoolExecutor(max_workers=len(self._slots)) as executor:
+            futures = [executor.submit(self._worker, slot, pending, results, len(jobs)) for slot in self._slots]
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    # 浏览器无法重启时该线程退出，剩余任务由其他线程继续处理，已有结果不受影响
+                    print(f"浏览器无法重启: {error_message(e)}")
+        # 所有浏览器都无法重启时，队列中剩余的任务记为失败
+        for position, job in enumerate(jobs):
+            if results[position] is None:
+                results[position] = self._failed_result(tuple(job), '浏览器无法启动')
+        return results
+
+
+def save_slide_node_as_image(slides_url, node_selector, output_path, quiet=0.5, settle_timeout=10.0):
+    # 初始化Chrome浏览器（无头模式，不显示窗口），chromedriver 路径只解析一次
+    driver = create_driver()
 
     try:
         # 访问Google Slides链接
@@ -29,8 +311,9 @@ def save_slide_node_as_image(slides_url, node_selector, output_path):
         WebDriverWait(driver, 20).until(
             EC.presence_of_element_located((By.CSS_SELECTOR, ".sketchyViewerContent"))
         )
-        # 额外等待几秒，确保动态内容（如SVG）完全渲染
-        time.sleep(5)
+        # 等待动态内容（如SVG）渲染稳定，最多等待 settle_timeout 秒
+        state, waited = wait_until_ready(driver, quiet, settle_timeout)
+        print(f"等待渲染 {waited:.2f}s ({state})")
 
         # 定位目标节点（根据实际需求修改选择器，例如div或svg的CSS选择器）
         # 示例：假设目标是第一个幻灯片中的svg节点
@@ -50,14 +333,178 @@ def save_slide_node_as_image(slides_url, node_selector, output_path):
         driver.quit()
 
 
-# 示例用法
-if __name__ == "__main__":
+# 节点内容的签名（长度+哈希），用来判断翻页后幻灯片是否已经切换，避免把整段 SVG 传回 Python
+SIGNATURE_SCRIPT = """
+const node = document.querySelector(arguments[0]);
+if (!node) return null;
+const html = node.outerHTML;
+let hash = 0;
+for (let i = 0; i < html.length; i++) { hash = (hash * 31 + html.charCodeAt(i)) | 0; }
+return html.length + ':' + hash;
+"""
+
+# 查看器中每张幻灯片对应一个元素（Google Slides 嵌入查看器中为跳转菜单的选项），用于读取总张数
+# 需根据实际页面结构调整，读取不到时按内容是否变化判断最后一张
+SLIDE_ITEM_SELECTOR = '.punch-viewer-nav-v2 .goog-menuitem[role="option"]'
+
+
+def deck_start_url(slides_url):
+    """Google Slides 链接去掉 slide 参数，从第一张幻灯片开始"""
+    parsed = urlparse(slides_url)
+    if 'docs.google.com' not in parsed.netloc:
+        return slides_url
+    query = [(k, v) for k, v in parse_qsl(parsed.query) if k != 'slide']
+    return parsed._replace(query=urlencode(query)).geturl()
+
+
+def _write_png(data, output_path):
+    """后台线程任务：解码截图数据并写入文件"""
+    with open(output_path, 'wb') as f:
+        f.write(base64.b64decode(data))
+    return output_path
+
+
+def capture_deck(slides_url, node_selector, output_dir, name_format='slide_{:03d}.png', max_slides=500,
+                 quiet=0.5, settle_timeout=10.0, change_timeout=5.0, driver=None,
+                 slide_count=None, slide_item_selector=SLIDE_ITEM_SELECTOR):
+    """
+    整套幻灯片截图：页面只加载一次，在页面内按方向键逐张翻页并截取目标节点，
+    截图数据的解码和写盘交给后台线程，与下一张的翻页、渲染同时进行
+
+    总张数取 slide_count，未指定时按 slide_item_selector 从查看器中读取，按总张数逐张翻页；
+    翻页后目标节点内容在 change_timeout 秒内没有变化时视为与上一张相同，照常截取。
+    读取不到总张数时，内容没有变化即视为已到最后一张，并提示可能提前结束
+    （与上一张完全相同的幻灯片也会结束截图）
+
+    :param slides_url: 演示文稿地址或本地 HTML 文件，Google Slides 链接从第一张开始
+    :param node_selector: 每张幻灯片中要截取的节点
+    :param output_dir: 输出目录，文件名为 name_format.format(序号)，序号从1开始
+    :param max_slides: 最多截取的张数
+    :param quiet/settle_timeout: 每张幻灯片等待渲染稳定的参数，见 wait_until_ready
+    :param driver: 复用已有的浏览器，不传时新建并在结束后关闭
+    :param slide_count: 幻灯片总张数，不传时从查看器中读取
+    :param slide_item_selector: 查看器中每张幻灯片对应的元素，用于读取总张数
+    :return: 每张幻灯片的结果列表 [{'slide', 'output', 'status', 'ready', 'waited', 'message'}, ...]
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    own_driver = driver is None
+    driver = driver or create_driver()
+    results = []
+    writer = ThreadPoolExecutor(max_workers=1)
+    pending = []
+    try:
+        driver.get(to_url(deck_start_url(slides_url)))
+        WebDriverWait(driver, 20).until(EC.presence_of_element_located((By.CSS_SELECTOR, node_selector)))
+
+        total = slide_count or driver.execute_script(
+            "return document.querySelectorAll(arguments[0]).length;", slide_item_selector)
+        if total:
+            print(f"共 {total} 张幻灯片")
+            if total > max_slides:
+                print(f"超过最多截取的张数，只截取前 {max_slides} 张")
+        else:
+            print("未能读取幻灯片总数，翻页后内容不再变化时视为最后一张")
+
+        signature = None
+        for number in range(1, min(total or max_slides, max_slides) + 1):
+            if number > 1:
+                # 翻到下一张，等待目标节点内容变化
+                ActionChains(driver).send_keys(Keys.ARROW_RIGHT).perform()
+                previous = signature
+                try:
+                    WebDriverWait(driver, change_timeout).until(
+                        lambda d: d.execute_script(SIGNATURE_SCRIPT, node_selector) not in (None, previous)
+                    )
+                except TimeoutException:
+                    if not total:
+                        print(f"第 {number - 1} 张之后 {change_timeout}s 内内容没有变化，视为最后一张"
+                              f"（若有与上一张相同的幻灯片，截图会提前结束，可用 slide_count 指定总张数）")
+                        break
+                    print(f"[{number}] 内容与上一张相同")
+
+            state, waited = wait_until_ready(driver, quiet, settle_timeout)
+            signature = driver.execute_script(SIGNATURE_SCRIPT, node_selector)
+            output_path = os.path.join(output_dir, name_format.format(number))
+            result = {'slide': number, 'output': output_path, 'status': 'saved', 'ready': state,
+                      'waited': waited, 'message': ''}
+            results.append(result)
+            try:
+                data = driver.find_element(By.CSS_SELECTOR, node_selector).screenshot_as_base64
+                pending.append((result, writer.submit(_write_png, data, output_path)))
+                print(f"[{number}] 已截取，等待渲染 {waited:.2f}s ({state})")
+            except WebDriverException as e:
+                result.update(status='failed', message=error_message(e))
+                print(f"[{number}] 操作失败：{result['message']}")
+    except Exception as e:
+        print(f"操作失败：{error_message(e)}")
+    finally:
+        for result, future in pending:
+            try:
+                future.result()
+            except OSError as e:
+                result.update(status='failed', message=str(e))
+        writer.shutdown()
+        if own_driver:
+            driver.quit()
+
+    saved = sum(r['status'] == 'saved' for r in results)
+    print(f"共 {len(results)} 张幻灯片，已保存 {saved} 张至：{output_dir}")
+    return results
+
+
+def load_jobs(jobs_path):
+    """
+    从JSON文件读取截图任务，格式为:
+        [{"url": "page.html", "selector": "svg", "output": "out/1.png"}, ...]
+    """
+    with open(jobs_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return [(item['url'], item['selector'], item['output']) for item in data]
+
+
+def main():
     # Google Slides分享链接（需确保权限为“任何人可查看”）
     slides_url = "https://docs.google.com/presentation/d/e/2PACX-1vQM62P6-WMrWmtwSjVFrDcarzv9ZBJ4qXedm3p0INV5xrRdxZ06ng_0H7naDhUvwQ/pubembed?start=true&loop=false&delayms=60000&pli=1&slide=id.p39"
     # 目标节点的CSS选择器（需根据实际页面结构调整，例如svg节点）
     # node_selector = ".punch-viewer-content svg"  # 示例：幻灯片内容中的svg
     node_selector = ".punch-viewer-svgpage-svgcontainer svg"  # 示例：幻灯片内容中的svg
-    # 输出图片路径
-    output_image = "slide_node_42.png"
 
-    save_slide_node_as_image(slides_url, node_selector, output_image)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='截取网页中的节点并保存为图片')
+    parser.add_argument('--url', default=slides_url, help='页面地址或本地 HTML 文件')
+    parser.add_argument('--selector', default=node_selector, help='目标节点的CSS选择器')
+    parser.add_argument('--output', default='slide_node_42.png', help='输出图片路径')
+    parser.add_argument('--jobs', help='批量任务JSON文件，指定后忽略 --url/--selector/--output')
+    parser.add_argument('--deck', metavar='OUTPUT_DIR', help='截取整套幻灯片（--url 的所有页）到指定目录')
+    parser.add_argument('--drivers', type=int, default=2, help='浏览器数量，默认为2')
+    parser.add_argument('--tabs', type=int, default=4, help='每个浏览器同时加载的标签页数，默认为4')
+    parser.add_argument('--recycle-after', type=int, default=50, help='浏览器处理多少个任务后重启，默认为50')
+    parser.add_argument('--quiet', type=float, default=0.5, help='DOM 连续无变化多少秒视为渲染完成，默认为0.5')
+    parser.add_argument('--settle-timeout', type=float, default=10.0, help='等待渲染完成的最长秒数，默认为10')
+    parser.add_argument('--slide-count', type=int, help='--deck 模式下的幻灯片总张数，默认从查看器中读取')
+    args = parser.parse_args()
+
+    if args.deck:
+        capture_deck(args.url, args.selector, args.deck, quiet=args.quiet, settle_timeout=args.settle_timeout,
+                     slide_count=args.slide_count)
+        return
+
+    if not args.jobs:
+        save_slide_node_as_image(args.url, args.selector, args.output, args.quiet, args.settle_timeout)
+        return
+
+    jobs = load_jobs(args.jobs)
+    started = time.perf_counter()
+    with CaptureService(min(args.drivers, len(jobs)) or 1, args.tabs, args.recycle_after,
+                        args.quiet, args.settle_timeout) as service:
+        results = service.capture(jobs)
+    failed = sum(r['status'] == 'failed' for r in results)
+    waited = [r['waited'] for r in results if r['status'] == 'saved']
+    print(f"完成: {len(results) - failed}/{len(results)}, 总耗时 {time.perf_counter() - started:.1f}s")
+    if waited:
+        print(f"等待渲染: 平均 {sum(waited) / len(waited):.2f}s, 最长 {max(waited):.2f}s, "
+              f"超时 {sum(r['ready'] != 'ready' for r in results if r['status'] == 'saved')} 个")
+
+
+# 示例用法
+if __name__ == "__main__":
+    main()
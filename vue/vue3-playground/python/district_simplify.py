@@ -0,0 +1,245 @@
+import argparse
+import glob
+import json
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from json_codecs import CODECS, check_codecs, compress_all, parse_codecs
+
+"""
+行政区边界预处理：解析 fetch_amap_district 保存的 polyline，按多个缩放级别简化，
+编码为紧凑的二进制格式，前端按当前缩放级别只下载对应的文件
+
+polyline 格式为 "lng,lat;lng,lat;...|lng,lat;..."，"|" 分隔多个闭合环
+
+输出格式:
+- delta: 坐标乘以 1e6 取整后按环做差分，存为 Int32Array，前端无需解析文本即可直接读取
+    b'DPL1' | uint32 缩放倍数 | uint32 环数 | uint32[环数] 每个环的点数 | int32[点数*2] 差分坐标 (lng, lat)
+    每个环的第一个点为绝对坐标，其余为与上一个点的差值，所有字段均为小端序
+- geobuf: 每个环作为 MultiPolygon 中的一个多边形，编码为 Geobuf（需要安装 geobuf）
+
+用法:
+    python district_simplify.py --input ./city_district --output ./city_district_bin --zooms 6,8,10,12
+"""
+
+DELTA_MAGIC = b'DPL1'
+COORD_SCALE = 1_000_000
+
+# 默认输出的缩放级别，另外总会输出不简化的完整版本（文件名中的级别为 full）
+DEFAULT_ZOOMS = (6, 8, 10, 12)
+
+
+def parse_polyline(polyline: str) -> List[np.ndarray]:
+    """
+    解析 polyline 字符串，整串坐标一次转换为数组，再按每个环的点数切分
+    :return: 每个环一个 (点数, 2) 的 float64 数组
+    """
+    if not polyline:
+        return []
+    rings = polyline.split('|')
+    counts = [ring.count(';') + 1 for ring in rings]
+    coords = np.fromstring(polyline.replace(';', ',').replace('|', ','), sep=',').reshape(-1, 2)
+    return np.split(coords, np.cumsum(counts)[:-1])
+
+
+def zoom_tolerance(zoom: int, pixels: float = 1.0) -> float:
+    """缩放级别下 pixels 个像素对应的经纬度跨度（Web 墨卡托，256 像素瓦片，按赤道计算）"""
+    return 360.0 / (256 * 2 ** zoom) * pixels
+
+
+def simplify_ring(points: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Douglas-Peucker 简化，按层处理：每一轮把所有待处理线段的内部点放在一起向量化计算
+    到各自首尾连线的距离，用 reduceat 求每段的最大值，Python 循环次数只等于递归深度
+    闭合环（首尾相同）先在距起点最远的点处分为两段，避免首尾连线退化为一个点
+    """
+    n = len(points)
+    if n <= 4 or tolerance <= 0:
+        return points
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    starts, ends = np.array([0]), np.array([n - 1])
+    if np.array_equal(points[0], points[-1]):
+        far = int(np.argmax(np.hypot(*(points - points[0]).T)))
+        keep[far] = True
+        starts, ends = np.array([0, far]), np.array([far, n - 1])
+
+    while len(starts):
+        counts = ends - starts - 1
+        valid = counts > 0
+        starts, ends, counts = starts[valid], ends[valid], counts[valid]
+        if not len(starts):
+            break
+        # 所有线段内部点的下标，以及每个点所属的线段
+        segment = np.repeat(np.arange(len(starts)), counts)
+        offsets = np.cumsum(counts) - counts
+        index = starts[segment] + 1 + np.arange(counts.sum()) - offsets[segment]
+
+        a = points[starts][segment]
+        direction = points[ends][segment] - a
+        relative = points[index] - a
+        length = np.hypot(direction[:, 0], direction[:, 1])
+        cross = np.abs(direction[:, 0] * relative[:, 1] - direction[:, 1] * relative[:, 0])
+        # 首尾重合的线段退化为到该点的距离
+        dist = np.where(length > 0, cross / np.where(length > 0, length, 1),
+                        np.hypot(relative[:, 0], relative[:, 1]))
+
+        # 每段距离最大的第一个点
+        segment_max = np.maximum.reduceat(dist, offsets)
+        candidates = np.flatnonzero(dist == segment_max[segment])
+        _, first = np.unique(segment[candidates], return_index=True)
+        middle = index[candidates[first]]
+
+        split = segment_max > tolerance
+        keep[middle[split]] = True
+        starts, ends = np.concatenate((starts[split], middle[split])), np.concatenate((middle[split], ends[split]))
+    return points[keep]
+
+
+def simplify_rings(rings: List[np.ndarray], tolerance: float) -> List[np.ndarray]:
+    """简化所有环，外接矩形小于容差的环（在该缩放级别下不足一个像素）直接丢弃"""
+    result = []
+    for ring in rings:
+        if tolerance > 0:
+            span = ring.max(axis=0) - ring.min(axis=0)
+            if span.max() < tolerance:
+                continue
+        simplified = simplify_ring(ring, tolerance)
+        if len(simplified) >= 3:
+            result.append(simplified)
+    return result
+
+
+def encode_delta(rings: List[np.ndarray]) -> bytes:
+    """编码为差分 Int32 数组，格式见模块说明"""
+    counts = np.array([len(ring) for ring in rings], dtype='<u4')
+    if rings:
+        quantized = np.rint(np.concatenate(rings) * COORD_SCALE).astype(np.int64)
+        deltas = np.diff(quantized, axis=0, prepend=0)
+        # 每个环的第一个点存绝对坐标
+        starts = np.concatenate(([0], np.cumsum(counts, dtype=np.int64)[:-1]))
+        deltas[starts] = quantized[starts]
+        body = deltas.astype('<i4').tobytes()
+    else:
+        body = b''
+    return DELTA_MAGIC + struct.pack('<II', COORD_SCALE, len(rings)) + counts.tobytes() + body
+
+
+def decode_delta(data: bytes) -> List[np.ndarray]:
+    """encode_delta 的逆过程，用于校验"""
+    if data[:4] != DELTA_MAGIC:
+        raise ValueError("不是 DPL1 格式的数据")
+    scale, ring_count = struct.unpack_from('<II', data, 4)
+    counts = np.frombuffer(data, dtype='<u4', count=ring_count, offset=12)
+    deltas = np.frombuffer(data, dtype='<i4', offset=12 + 4 * ring_count).reshape(-1, 2).astype(np.int64)
+    return [np.cumsum(chunk, axis=0) / scale for chunk in np.split(deltas, np.cumsum(counts)[:-1])]
+
+
+def encode_geobuf(rings: List[np.ndarray]) -> bytes:
+    import geobuf
+    feature = {
+        'type': 'Feature',
+        'properties': {},
+        'geometry': {'type': 'MultiPolygon', 'coordinates': [[ring.tolist()] for ring in rings]},
+    }
+    return geobuf.encode(feature, 6)
+
+
+ENCODERS = {
+    'delta': ('.bin', encode_delta),
+    'geobuf': ('.pbf', encode_geobuf),
+}
+
+
+def process_district_file(json_path: str, output_dir: str, zooms: Sequence[int], fmt: str,
+                          codecs: Sequence[str]) -> Tuple[str, int, List[Tuple[str, int, int]], str]:
+    """
+    处理一个城市的 JSON 文件（进程池任务，需为模块级函数）
+    输出文件名为 城市.z{级别}{.bin|.pbf}，以及按 codecs 压缩的版本
+    :return: (城市名, 原始 JSON 大小, [(输出文件名, 点数, 大小), ...], 错误信息)
+    """
+    city = os.path.basename(json_path)[:-len('.json')]
+    extension, encoder = ENCODERS[fmt]
+    outputs = []
+    try:
+        with open(json_path, 'rb') as f:
+            raw = f.read()
+        data = json.loads(raw)
+        if str(data.get('status')) == '0':
+            return city, len(raw), outputs, f"响应状态异常: {data.get('info')}"
+        rings = []
+        for district in data.get('districts', []):
+            rings.extend(parse_polyline(district.get('polyline') or ''))
+
+        levels = [(f"z{zoom}", zoom_tolerance(zoom)) for zoom in sorted(zooms)] + [('full', 0.0)]
+        for level, tolerance in levels:
+            simplified = simplify_rings(rings, tolerance)
+            encoded = encoder(simplified)
+            filename = f"{city}.{level}{extension}"
+            files = {filename: encoded}
+            for name, compressed in compress_all(encoded, list(codecs)).items():
+                files[filename + CODECS[name].extension] = compressed
+            for name, content in files.items():
+                tmp_path = os.path.join(output_dir, name + '.tmp')
+                with open(tmp_path, 'wb') as f:
+                    f.write(content)
+                os.replace(tmp_path, os.path.join(output_dir, name))
+                outputs.append((name, sum(len(r) for r in simplified), len(content)))
+        return city, len(raw), outputs, ''
+    except Exception as e:
+        return city, 0, outputs, str(e)
+
+
+def process_district_dir(input_dir: str, output_dir: str, zooms: Sequence[int] = DEFAULT_ZOOMS,
+                         fmt: str = 'delta', codecs: Sequence[str] = ('gzip',), max_workers: int = None):
+    """用进程池处理目录中的所有城市 JSON，打印每个城市各级别的点数和文件大小"""
+    check_codecs(codecs)
+    os.makedirs(output_dir, exist_ok=True)
+    files = sorted(glob.glob(os.path.join(input_dir, '*.json')))
+    started = time.perf_counter()
+    total_raw = 0
+    total_by_level = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(process_district_file, files, [output_dir] * len(files), [zooms] * len(files),
+                               [fmt] * len(files), [codecs] * len(files))
+        for i, (city, raw_size, outputs, error) in enumerate(results, 1):
+            if error:
+                print(f"[{i}/{len(files)}] 处理 {city} 失败: {error}")
+                continue
+            total_raw += raw_size
+            summary = []
+            for name, points, size in outputs:
+                level_name = name[len(city) + 1:]
+                total_by_level[level_name] = total_by_level.get(level_name, 0) + size
+                if level_name.count('.') == 1:
+                    summary.append(f"{level_name.split('.')[0]}={points}点")
+            print(f"[{i}/{len(files)}] {city} ({raw_size:,} bytes): {', '.join(summary)}")
+
+    print(f"完成: {len(files)} 个文件，耗时 {time.perf_counter() - started:.1f}s，原始 JSON 共 {total_raw:,} bytes")
+    for level_name, size in sorted(total_by_level.items()):
+        ratio = size / total_raw if total_raw else 0
+        print(f"  *.{level_name:<16} {size:>14,} bytes ({ratio:.1%})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='简化行政区边界并编码为紧凑的二进制格式')
+    parser.add_argument('--input', default='./city_district', help='fetch_amap_district 保存的 JSON 目录')
+    parser.add_argument('--output', default='./city_district_bin', help='输出目录')
+    parser.add_argument('--zooms', default=','.join(map(str, DEFAULT_ZOOMS)),
+                        help='简化的缩放级别，默认为 6,8,10,12，另外总会输出完整版本')
+    parser.add_argument('--format', choices=list(ENCODERS), default='delta', help='输出格式，默认为delta')
+    parser.add_argument('--codecs', default='gzip', help='同时输出的压缩版本，见 json_codecs，默认为gzip')
+    parser.add_argument('--workers', type=int, help='进程数，默认为CPU核数')
+    args = parser.parse_args()
+    try:
+        codec_names = parse_codecs(args.codecs)
+    except ValueError as e:
+        parser.error(str(e))
+
+    process_district_dir(args.input, args.output, [int(z) for z in args.zooms.split(',') if z.strip()],
+                         args.format, codec_names, args.workers)
@@ -1,12 +1,64 @@
+import argparse
+import hashlib
 import json
+import random
+import threading
 import time
 import requests
-from typing import List
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
 import os
-import gzip
 from collections import Counter
 from dotenv import load_dotenv
 
+from json_codecs import CODECS, check_codecs, compress_all, parse_codecs
+
+# 高德返回这些 infocode 表示触发了 QPS 限制或服务繁忙，稍后重试即可
+RETRY_INFOCODES = {'10014', '10015', '10016', '10019', '10020', '10021'}
+# 这些 HTTP 状态码同样重试
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# 输出目录中记录每个城市请求状态的清单
+MANIFEST_NAME = '.fetch_manifest.json'
+
+
+class TokenBucket:
+    """
+    线程安全的令牌桶，所有请求线程共用，保证总请求速率不超过 rate 次/秒
+    capacity 为允许的突发请求数，默认为1，请求均匀分布，不会在某一秒内超出 QPS
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """取一个令牌，令牌不足时等待"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def create_session(pool_size: int) -> requests.Session:
+    """创建复用连接的会话，连接池大小与并发数一致"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
 def request_gaode_api(city_name: str, api_url_template: str) -> dict:
     """
     请求高德接口
@@ -28,6 +80,128 @@ def request_gaode_api(city_name: str, api_url_template: str) -> dict:
         print(f"JSON解析失败 - 城市: {city_name}, 错误: {e}")
         return {"error": "Invalid JSON response"}
 
+def fetch_city(session: requests.Session, city_name: str, api_url_template: str, bucket: TokenBucket,
+               retries: int = 3, backoff: float = 0.5) -> Tuple[Optional[dict], int, str]:
+    """
+    请求单个城市，每次请求（包括重试）前从令牌桶取令牌
+    网络错误、5xx/429 以及 QPS 超限的响应按指数退避加随机抖动重试；
+    其他 4xx（如 403/404）以及不是 JSON 对象的响应重试也不会成功，直接返回失败，不浪费令牌
+    :return: (响应数据, 请求次数, 错误信息)，失败时响应数据为 None
+    """
+    error = ''
+    for attempt in range(1, retries + 2):
+        bucket.acquire()
+        try:
+            response = session.get(api_url_template + city_name, timeout=10)
+            if response.status_code in RETRY_STATUS_CODES:
+                error = f"HTTP {response.status_code}"
+            elif 400 <= response.status_code < 500:
+                return None, attempt, f"HTTP {response.status_code}"
+            else:
+                response.raise_for_status()
+                data = response.json()
+                if not isinstance(data, dict):
+                    return None, attempt, f"响应不是 JSON 对象: {type(data).__name__}"
+                if str(data.get('infocode')) not in RETRY_INFOCODES:
+                    return data, attempt, ''
+                error = f"{data.get('info')} ({data.get('infocode')})"
+        except json.JSONDecodeError:
+            # requests 的 JSONDecodeError 同时继承 RequestException，需先捕获
+            error = "Invalid JSON response"
+        except requests.exceptions.RequestException as e:
+            error = str(e)
+        if attempt <= retries:
+            # 随机抖动避免多个线程同时重试，再次撞上限流
+            time.sleep(backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+    return None, retries + 1, error
+
+
+def fetch_cities_concurrently(city_list: List[str], api_url_template: str, output_dir: str,
+                              max_per_second: float = 10, max_workers: Optional[int] = None,
+                              retries: int = 3, resume: bool = True,
+                              codecs: Sequence[str] = ('gzip',)) -> List[dict]:
+    """
+    并发请求城市列表：令牌桶控制总速率，线程池限制同时进行的请求数，连接复用
+    并发数默认为速率的2倍，足以覆盖请求延迟，使实际速率保持在 max_per_second
+
+    输出目录中的清单记录每个城市的状态、响应内容哈希和时间，resume 为 True 时
+    已成功且文件仍在的城市直接跳过（不发请求），只重新请求失败和未完成的城市；
+    城市列表先去重，重复的城市只请求一次
+    codecs 为保存的压缩编码，见 json_codecs.CODECS，有不可用的编码时在发出请求前抛出 ValueError
+    :return: 本次请求的城市结果 [{'city', 'status', 'attempts', 'error'}, ...]，status 为 saved/failed
+    """
+    check_codecs(codecs)
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path) if resume else {}
+    city_list = dedupe_cities(city_list)
+    done = [city for city in city_list if manifest.get(city, {}).get('status') == 'saved'
+            and os.path.exists(os.path.join(output_dir, f"{city}.json"))]
+    if done:
+        print(f"跳过已完成的 {len(done)} 个城市")
+        done = set(done)
+        city_list = [city for city in city_list if city not in done]
+    if not city_list:
+        return []
+
+    max_workers = max_workers or max(1, int(max_per_second * 2))
+    bucket = TokenBucket(max_per_second)
+    session = create_session(max_workers)
+    total_cities = len(city_list)
+    results = []
+    started = time.monotonic()
+
+    def fetch_and_save(city_name):
+        try:
+            return _fetch_and_save(city_name)
+        except Exception as e:
+            # 单个城市的意外错误只记为该城市失败，不中断整批请求
+            return {'city': city_name, 'status': 'failed', 'attempts': 0, 'error': str(e)}
+
+    def _fetch_and_save(city_name):
+        data, attempts, error = fetch_city(session, process_city_name(city_name), api_url_template, bucket, retries)
+        if data is None:
+            return {'city': city_name, 'status': 'failed', 'attempts': attempts, 'error': error}
+        # status 为 0 表示请求被拒绝（例如 key 无效），不保存，下次重新请求
+        if str(data.get('status')) == '0':
+            return {'city': city_name, 'status': 'failed', 'attempts': attempts,
+                    'error': f"{data.get('info')} ({data.get('infocode')})"}
+        digest = save_json_response(data, city_name, output_dir, codecs)
+        if digest is None:
+            return {'city': city_name, 'status': 'failed', 'attempts': attempts, 'error': "保存文件失败"}
+        return {'city': city_name, 'status': 'saved', 'attempts': attempts, 'error': '', 'sha256': digest}
+
+    print(f"开始处理 {total_cities} 个城市（{max_per_second} 次/秒，并发 {max_workers}）...")
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(fetch_and_save, city) for city in city_list]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                manifest[result['city']] = {
+                    'status': result['status'],
+                    'sha256': result.get('sha256'),
+                    'updated': datetime.now().isoformat(timespec='seconds'),
+                    'error': result['error'],
+                }
+                if len(results) % 20 == 0:
+                    save_manifest(manifest_path, manifest)
+                if result['status'] == 'failed':
+                    print(f"[{len(results)}/{total_cities}] 请求接口失败 - 城市: {result['city']}, "
+                          f"错误: {result['error']}（已尝试 {result['attempts']} 次）")
+    finally:
+        session.close()
+        save_manifest(manifest_path, manifest)
+
+    elapsed = time.monotonic() - started
+    requests_sent = sum(r['attempts'] for r in results)
+    saved = sum(r['status'] == 'saved' for r in results)
+    print(f"处理完成！成功处理 {saved}/{total_cities} 个城市，共 {requests_sent} 次请求，"
+          f"耗时 {elapsed:.1f}s（{requests_sent / elapsed if elapsed else 0:.1f} 次/秒）")
+    print(f"文件保存在: {os.path.abspath(output_dir)}")
+    return results
+
+
 def process_city_name(city_name: str) -> str:
     """
     处理城市名称：如果以"市"结尾，移除末尾的"市"字
@@ -36,9 +210,20 @@ def process_city_name(city_name: str) -> str:
     #     return city_name[:-1]
     return city_name
 
-def save_json_response(response_data: dict, city_name: str, output_dir: str):
+def write_file_atomic(filepath: str, data: bytes):
+    """先写临时文件再替换，进程被中断时不会留下不完整的文件"""
+    tmp_path = filepath + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, filepath)
+
+
+def save_json_response(response_data: dict, city_name: str, output_dir: str,
+                       codecs: Sequence[str] = ('gzip',)) -> Optional[str]:
     """
-    将JSON响应保存到本地文件
+    将JSON响应保存到本地文件，并按 codecs 保存压缩版本（文件名为 城市.json + 编码扩展名，见 json_codecs）
+    只序列化一次，所有编码共用同一份字节串，多个编码并行压缩
+    :return: JSON 内容的 SHA-256，保存失败时返回 None
     """
     # 确保输出目录存在
     os.makedirs(output_dir, exist_ok=True)
@@ -46,82 +231,71 @@ def save_json_response(response_data: dict, city_name: str, output_dir: str):
     try:
         # 将JSON数据转换为紧凑格式的字节串
         # 使用separators参数去除不必要的空格，实现紧凑压缩
-        json_text = json.dumps(response_data, ensure_ascii=False, 
-                                separators=(',', ':'), indent=None)
+        json_bytes = json.dumps(response_data, ensure_ascii=False,
+                                separators=(',', ':'), indent=None).encode('utf-8')
     
         # 构建文件名
+        # 请求成功后总是覆盖写入，是否需要重新请求只由清单决定
         filepath_json = os.path.join(output_dir, f"{city_name}.json")
-        if not os.path.exists(filepath_json):
-            # 使用紧凑压缩格式保存JSON
-            with open(filepath_json, 'w', encoding='utf-8') as f:
-                f.write(json_text)
-            print(f"已保存: {filepath_json}")
-        else:
-          print(f"跳过: {filepath_json}")
-
-        filepath_gzip = os.path.join(output_dir, f"{city_name}.json.gz")
-        if not os.path.exists(filepath_gzip):
-            # 使用gzip压缩字节数据
-            compressed_data = gzip.compress(json_text.encode('utf-8'), compresslevel=6)
-            # 写入gzip文件
-            with open(filepath_gzip, 'wb') as f:
-                f.write(compressed_data)
-            # 获取压缩后的文件大小
-            file_size = os.path.getsize(filepath_gzip)
-            original_size = len(json_text)
+        # 使用紧凑压缩格式保存JSON
+        write_file_atomic(filepath_json, json_bytes)
+        print(f"已保存: {filepath_json}")
+
+        for name, compressed_data in compress_all(json_bytes, list(codecs)).items():
+            filepath = os.path.join(output_dir, f"{city_name}.json{CODECS[name].extension}")
+            write_file_atomic(filepath, compressed_data)
+            # 压缩后的大小和压缩率
+            file_size = len(compressed_data)
+            original_size = len(json_bytes)
             compression_ratio = file_size / original_size if original_size > 0 else 0
-            print(f"已保存: {filepath_gzip} ({file_size:,} bytes, 压缩率: {compression_ratio:.1%})")
-        else:
-          print(f"跳过: {filepath_json}")
+            print(f"已保存: {filepath} ({file_size:,} bytes, 压缩率: {compression_ratio:.1%})")
+        return hashlib.sha256(json_bytes).hexdigest()
     except Exception as e:
         print(f"保存文件失败 - 城市: {city_name}, 错误: {e}")
+        return None
+
+
+def load_manifest(manifest_path: str) -> dict:
+    """读取清单，不存在或损坏时返回空清单"""
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_manifest(manifest_path: str, manifest: dict):
+    write_file_atomic(manifest_path, json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8'))
+
+
+def dedupe_cities(city_list: List[str]) -> List[str]:
+    """去掉重复的城市，保持原顺序"""
+    counter = Counter(city_list)
+    for target, count in counter.items():
+        if count > 1:
+            print(f"重复: {target}（{count} 次，只请求一次）")
+    return list(dict.fromkeys(city_list))
+
 
 def process_cities_with_rate_limit(city_list: List[str], api_url_template: str, 
                                    output_dir: str, max_per_second: int = 10):
     """
-    处理城市列表，限制每秒请求次数
+    处理城市列表，限制每秒请求次数（并发请求，见 fetch_cities_concurrently）
     """
-    total_cities = len(city_list)
-    processed_count = 0
-    
-    print(f"开始处理 {total_cities} 个城市...")
-    
-    # 计算每次请求之间的最小时间间隔（秒）
-    min_interval = 1.0 / max_per_second
-    
-    for i, original_city_name in enumerate(city_list, 1):
-        try:
-            # 1. 处理城市名称
-            processed_city_name = process_city_name(original_city_name)
-            
-            # 记录开始时间
-            start_time = time.time()
-            
-            # 2. 请求高德接口
-            print(f"[{i}/{total_cities}] 处理中: {original_city_name} -> {processed_city_name}")
-            response_data = request_gaode_api(processed_city_name, api_url_template)
-            
-            # 3. 保存响应到本地
-            save_json_response(response_data, original_city_name, output_dir)
-            
-            processed_count += 1
-            
-            # 4. 控制请求频率
-            elapsed_time = time.time() - start_time
-            
-            # 如果处理时间小于最小间隔，则等待剩余时间
-            if elapsed_time < min_interval:
-                wait_time = min_interval - elapsed_time
-                time.sleep(wait_time)
-                
-        except Exception as e:
-            print(f"处理城市失败: {original_city_name}, 错误: {e}")
-            continue
-    
-    print(f"处理完成！成功处理 {processed_count}/{total_cities} 个城市")
-    print(f"文件保存在: {os.path.abspath(output_dir)}")
+    return fetch_cities_concurrently(city_list, api_url_template, output_dir, max_per_second)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='并发请求高德行政区划接口，保存各城市的边界 JSON')
+    parser.add_argument('--output', default='./city_district', help='保存目录，默认为 ./city_district')
+    parser.add_argument('--rate', type=float, default=2, help='每秒请求次数，默认为2')
+    parser.add_argument('--codecs', default='gzip', help='同时保存的压缩版本，见 json_codecs，默认为gzip')
+    args = parser.parse_args()
+    # 编码名称在请求前检查，避免请求成功后才在保存时出错
+    try:
+        codec_names = parse_codecs(args.codecs)
+    except ValueError as e:
+        parser.error(str(e))
+
     load_dotenv()
 
     amap_js_key = os.getenv("AMAP_JS_KEY")
@@ -136,12 +310,9 @@ if __name__ == "__main__":
     api_url_template = f"https://restapi.amap.com/v3/config/district?platform=JS&s=rsv3&logversion=2.0&key={amap_js_key}&sdkversion=2.0.6.4&appname=http%253A%252F%252Flocalhost%253A5173%252Fmap%252Famap-district&csid=1BB81942-EE6A-4084-9BB6-4A86639E811C&jscode={amap_js_code}&subdistrict=0&extensions=all&level=city&showbiz=false&key={amap_js_key}&s=rsv3&keywords="
     
     # 指定本地保存目录
-    output_directory = "./city_district"
+    output_directory = args.output
     
-    # 开始处理
-    # process_cities_with_rate_limit(cityList, api_url_template, output_directory, 2)
-    counter = Counter(cityList)
-    duplicates = [item for item, count in counter.items() if count > 1]
-    for target in duplicates:
-        print(f"重复: {target}")
+    # 开始处理：城市列表会先去重，中断后重新运行只请求失败和未完成的城市
+    # fetch_cities_concurrently(cityList, api_url_template, output_directory, args.rate, codecs=codec_names)
+    dedupe_cities(cityList)
 
@@ -0,0 +1,150 @@
+import argparse
+import glob
+import gzip
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Sequence
+
+"""
+JSON 响应的压缩编码
+
+所有编码都基于同一份序列化后的字节串，多个编码在线程池中并行压缩
+（zlib 和 cramjam 压缩时都会释放 GIL）。
+gzip 始终可用；brotli 优先使用 brotli 模块，没有时使用 cramjam；
+snappy / lz4 / zstd 需要安装 cramjam，未安装时这些编码不可用。
+
+基准测试：
+    python json_codecs.py --input ./city_district
+"""
+
+try:
+    import cramjam
+except ImportError:
+    cramjam = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class Codec(NamedTuple):
+    extension: str
+    compress: Callable[[bytes], bytes]
+    decompress: Callable[[bytes], bytes]
+
+
+def _available_codecs() -> Dict[str, Codec]:
+    codecs = {
+        'gzip': Codec('.gz', lambda data: gzip.compress(data, compresslevel=6), gzip.decompress),
+    }
+    if brotli is not None:
+        codecs['brotli'] = Codec('.br', lambda data: brotli.compress(data, quality=11), brotli.decompress)
+    elif cramjam is not None:
+        codecs['brotli'] = Codec('.br', lambda data: bytes(cramjam.brotli.compress(data, level=11)),
+                                 lambda data: bytes(cramjam.brotli.decompress(data)))
+    if cramjam is not None:
+        # snappy 使用不带分帧的原始格式，与浏览器端常用的 snappyjs 一致；lz4 使用标准的帧格式
+        codecs['snappy'] = Codec('.snappy', lambda data: bytes(cramjam.snappy.compress_raw(data)),
+                                 lambda data: bytes(cramjam.snappy.decompress_raw(data)))
+        codecs['lz4'] = Codec('.lz4', lambda data: bytes(cramjam.lz4.compress(data)),
+                              lambda data: bytes(cramjam.lz4.decompress(data)))
+        codecs['zstd'] = Codec('.zst', lambda data: bytes(cramjam.zstd.compress(data, level=19)),
+                               lambda data: bytes(cramjam.zstd.decompress(data)))
+    return codecs
+
+
+# 当前环境可用的编码
+CODECS = _available_codecs()
+
+
+def parse_codecs(text: str) -> List[str]:
+    """解析逗号分隔的编码名称，有当前环境不可用的编码时报错"""
+    names = [n.strip() for n in text.split(',') if n.strip()]
+    check_codecs(names)
+    return names
+
+
+def check_codecs(names: Sequence[str]):
+    """检查编码名称都在当前环境可用，否则抛出 ValueError"""
+    unknown = [name for name in names if name not in CODECS]
+    if unknown:
+        raise ValueError(f"编码不可用: {', '.join(unknown)}（可用: {', '.join(CODECS)}）")
+
+
+def compress_all(data: bytes, names: List[str]) -> Dict[str, bytes]:
+    """用多个编码并行压缩同一份数据"""
+    if len(names) <= 1:
+        return {name: CODECS[name].compress(data) for name in names}
+    with ThreadPoolExecutor(max_workers=len(names)) as executor:
+        return dict(zip(names, executor.map(lambda name: CODECS[name].compress(data), names)))
+
+
+def benchmark_codecs(paths: List[str], names: List[str], repeat: int = 3) -> List[dict]:
+    """
+    对一组 JSON 文件测试各编码的压缩率和编解码速度，每个文件重复 repeat 次取最快的一次
+    :return: [{'codec', 'original', 'compressed', 'ratio', 'encode_mb_s', 'decode_mb_s'}, ...]
+    """
+    corpus = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            corpus.append((path, f.read()))
+    original = sum(len(data) for _, data in corpus)
+
+    results = []
+    for name in names:
+        codec = CODECS[name]
+        compressed_size = 0
+        encode_seconds = 0.0
+        decode_seconds = 0.0
+        for path, data in corpus:
+            best_encode = best_decode = float('inf')
+            for _ in range(repeat):
+                started = time.perf_counter()
+                compressed = codec.compress(data)
+                best_encode = min(best_encode, time.perf_counter() - started)
+                started = time.perf_counter()
+                restored = codec.decompress(compressed)
+                best_decode = min(best_decode, time.perf_counter() - started)
+            if restored != data:
+                raise ValueError(f"{name} 解压结果与原数据不一致: {path}")
+            compressed_size += len(compressed)
+            encode_seconds += best_encode
+            decode_seconds += best_decode
+        mb = original / 1024 / 1024
+        results.append({
+            'codec': name,
+            'original': original,
+            'compressed': compressed_size,
+            'ratio': compressed_size / original if original else 0,
+            'encode_mb_s': mb / encode_seconds if encode_seconds else 0,
+            'decode_mb_s': mb / decode_seconds if decode_seconds else 0,
+        })
+    return results
+
+
+def print_benchmark(results: List[dict]):
+    print(f"{'codec':<8} {'size':>14} {'ratio':>7} {'encode MB/s':>12} {'decode MB/s':>12}")
+    for r in sorted(results, key=lambda r: r['compressed']):
+        print(f"{r['codec']:<8} {r['compressed']:>14,} {r['ratio']:>7.1%} "
+              f"{r['encode_mb_s']:>12.1f} {r['decode_mb_s']:>12.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='测试各压缩编码在行政区划 JSON 上的压缩率和速度')
+    parser.add_argument('--input', default='./city_district', help='JSON 文件目录，默认为 ./city_district')
+    parser.add_argument('--codecs', default=','.join(CODECS), help=f"要测试的编码，默认为全部可用编码: {','.join(CODECS)}")
+    parser.add_argument('--repeat', type=int, default=3, help='每个文件重复次数，默认为3')
+    args = parser.parse_args()
+    try:
+        names = parse_codecs(args.codecs)
+    except ValueError as e:
+        parser.error(str(e))
+
+    files = sorted(glob.glob(os.path.join(args.input, '*.json')))
+    if not files:
+        print(f"目录中没有 JSON 文件: {args.input}")
+    else:
+        print(f"共 {len(files)} 个文件，{sum(os.path.getsize(p) for p in files):,} bytes")
+        print_benchmark(benchmark_codecs(files, names, args.repeat))